@@ -0,0 +1,82 @@
+# Compare two benchmarks/suite.py reports and flag regressions.
+#
+#   python benchmarks/compare.py baseline.json results.json [--threshold 0.10]
+#
+# Cases are matched by their "key". A case regresses when its median latency
+# or traced peak memory grows by more than --threshold (relative) and by more
+# than a small absolute floor, so sub-millisecond jitter isn't reported, or
+# when it now fails where it used to pass. Exits non-zero on any regression.
+
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.10
+
+# Absolute changes below these are noise
+MIN_DELTA_S = 0.002
+MIN_DELTA_MB = 1.0
+
+METRICS = (("p50_s", MIN_DELTA_S), ("peak_traced_mb", MIN_DELTA_MB))
+
+def load(path):
+    with open(path) as f:
+        return {r["key"]: r for r in json.load(f)["results"]}
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    rows = []
+    for key, new in current.items():
+        old = baseline.get(key)
+        if old is None:
+            rows.append({"key": key, "status": "new"})
+            continue
+        if "error" in new:
+            status = "still failing" if "error" in old else "regression"
+            rows.append({"key": key, "status": status, "error": new["error"]})
+            continue
+        if "error" in old:
+            rows.append({"key": key, "status": "fixed"})
+            continue
+        row = {"key": key, "status": "ok"}
+        for metric, floor in METRICS:
+            if metric not in old or metric not in new:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            row[metric] = {"baseline": old[metric], "current": new[metric], "change": change}
+            if change > threshold and new[metric] - old[metric] > floor:
+                row["status"] = "regression"
+            elif change < -threshold and old[metric] - new[metric] > floor and row["status"] == "ok":
+                row["status"] = "improved"
+        rows.append(row)
+    for key in baseline.keys() - current.keys():
+        rows.append({"key": key, "status": "missing"})
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative change that counts as a regression (default 0.10)")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    rows = compare(load(args.baseline), load(args.current), args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            changes = ", ".join(
+                f"{metric} {row[metric]['change']:+.1%}" for metric, _ in METRICS if metric in row
+            )
+            print(f"{row['status']:>13}  {row['key']}" + (f"  ({changes})" if changes else ""))
+
+    regressions = [row for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"FAIL: {len(regressions)} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
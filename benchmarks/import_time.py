@@ -0,0 +1,69 @@
+# Cold-import time check for the headless engine.
+#
+#   python benchmarks/import_time.py [--runs 5] [--budget 0.5]
+#
+# Every run imports `enhancer` in a fresh interpreter so nothing is warm in
+# sys.modules. Exits non-zero if the median exceeds the budget or if a UI-only
+# dependency was dragged in.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_SECONDS = 0.5
+
+FORBIDDEN_MODULES = ("streamlit", "skimage", "matplotlib", "streamlit_image_comparison")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import enhancer
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "forbidden": [m for m in %r if m in sys.modules],
+}))
+""" % (FORBIDDEN_MODULES,)
+
+def measure_once():
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the enhancer package")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS)
+    args = parser.parse_args(argv)
+
+    samples = [measure_once() for _ in range(args.runs)]
+    seconds = [s["seconds"] for s in samples]
+    forbidden = sorted({m for s in samples for m in s["forbidden"]})
+    report = {
+        "runs": args.runs,
+        "budget_seconds": args.budget,
+        "min_seconds": min(seconds),
+        "median_seconds": statistics.median(seconds),
+        "max_seconds": max(seconds),
+        "forbidden_modules": forbidden,
+    }
+    print(json.dumps(report, indent=2))
+
+    if forbidden:
+        print(f"FAIL: importing enhancer loaded {', '.join(forbidden)}", file=sys.stderr)
+        return 1
+    if report["median_seconds"] > args.budget:
+        print(f"FAIL: median import {report['median_seconds']:.3f}s exceeds {args.budget:.3f}s budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
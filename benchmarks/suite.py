@@ -0,0 +1,335 @@
+# Benchmark suite for the enhancement techniques, the end-to-end path and
+# user storage.
+#
+#   python benchmarks/suite.py [--sizes 1,4,16] [--channels 1,3] [--dtypes uint8]
+#                              [--ops Histogram,Denoise] [-o results.json]
+#   python benchmarks/compare.py baseline.json results.json
+#
+# Inputs are synthetic and seeded (a smooth gradient plus noise), so two runs
+# on the same machine see identical pixels. Every case runs in a fresh
+# interpreter: peak RSS is per process, and a 100 MP case shouldn't inflate the
+# numbers of the next one. Each case repeats until it has --runs samples or has
+# spent --case-budget seconds, whichever comes first (always at least one).
+# A case that raises (e.g. a dtype an operation doesn't support) is reported
+# with its error instead of aborting the suite.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = "1,4,16"
+DEFAULT_RUNS = 5
+DEFAULT_CASE_BUDGET_S = 60.0
+SEED = 1234
+
+# End-to-end recipe: decode → denoise → equalize → sharpen → encode
+E2E_STEPS = [("Denoise", {"tier": "auto"}), "Histogram", "Sharpening"]
+E2E_FORMATS = ("PNG", "JPEG")
+
+# History lengths the storage benchmark is run at
+STORE_HISTORY_SIZES = "0,1000,10000,100000"
+
+
+# SYNTHETIC INPUTS
+
+def make_image(megapixels, channels=3, dtype="uint8", seed=SEED):
+    import numpy as np
+
+    height = max(1, int(round((megapixels * 1e6 * 3 / 4) ** 0.5)))
+    width = max(1, int(round(megapixels * 1e6 / height)))
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    # Each channel gets a differently oriented gradient
+    planes = []
+    for c in range(channels):
+        plane = (x * (c + 1) + y * (channels - c)) / (channels + 1)
+        plane = plane + rng.normal(0, 0.05, (height, width)).astype(np.float32)
+        planes.append(plane)
+    image = np.clip(np.stack(planes, axis=-1), 0, 1)
+    if channels == 1:
+        image = image[:, :, 0]
+    maximum = np.iinfo(dtype).max
+    return (image * maximum).astype(dtype)
+
+
+# MEASUREMENT
+
+def _peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_s": ordered[0],
+        "p50_s": statistics.median(ordered),
+        "p95_s": _percentile(ordered, 0.95),
+        "max_s": ordered[-1],
+    }
+
+def measure(func, runs, budget_s):
+    # One warm-up under tracemalloc gives the peak of traced (numpy) memory;
+    # the RSS delta also catches OpenCV's internal buffers
+    baseline_rss = _peak_rss_bytes()
+    tracemalloc.start()
+    func()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = []
+    spent = 0.0
+    while len(samples) < runs and (not samples or spent < budget_s):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+        spent += samples[-1]
+
+    result = summarize(samples)
+    result["peak_traced_mb"] = traced_peak / 2 ** 20
+    if baseline_rss is not None:
+        result["peak_rss_delta_mb"] = (_peak_rss_bytes() - baseline_rss) / 2 ** 20
+    return result
+
+
+# CASES
+# Each case is a JSON-serializable dict; run_case() executes it in the child.
+
+def operation_cases(ops, sizes, channels, dtypes):
+    from enhancer import DENOISE_TIERS, OPERATIONS
+
+    cases = []
+    for name in ops or list(OPERATIONS):
+        variants = [{"tier": tier} for tier in DENOISE_TIERS] if name == "Denoise" else [{}]
+        for params in variants:
+            for mp in sizes:
+                for c in channels:
+                    for dtype in dtypes:
+                        cases.append({
+                            "kind": "operation", "name": name, "params": params,
+                            "megapixels": mp, "channels": c, "dtype": dtype,
+                        })
+    return cases
+
+def e2e_cases(sizes):
+    return [
+        {"kind": "e2e", "name": "decode-enhance-encode", "format": fmt, "megapixels": mp,
+         "channels": 3, "dtype": "uint8"}
+        for mp in sizes for fmt in E2E_FORMATS
+    ]
+
+def store_cases(history_sizes):
+    return [{"kind": "store", "name": name, "history": n}
+            for n in history_sizes for name in ("store.record_enhancement", "json.save_users")]
+
+def case_key(case):
+    parts = [case["kind"], case["name"]]
+    parts += [f"{k}={v}" for k, v in sorted(case.get("params", {}).items())]
+    if "format" in case:
+        parts.append(case["format"])
+    if "megapixels" in case:
+        parts.append(f"{case['megapixels']}MP {case['channels']}c {case['dtype']}")
+    if "history" in case:
+        parts.append(f"history={case['history']}")
+    return " | ".join(parts)
+
+def run_case(case, runs, budget_s):
+    kind = case["kind"]
+    if kind == "operation":
+        return _run_operation(case, runs, budget_s)
+    if kind == "e2e":
+        return _run_e2e(case, runs, budget_s)
+    if kind == "store":
+        return _run_store(case, runs, budget_s)
+    raise ValueError(f"Unknown case kind: {kind}")
+
+def _run_operation(case, runs, budget_s):
+    from enhancer import apply_technique
+
+    image = make_image(case["megapixels"], case["channels"], case["dtype"])
+    result = measure(lambda: apply_technique(case["name"], image, **case["params"]), runs, budget_s)
+    result["mp_per_s"] = image.shape[0] * image.shape[1] / 1e6 / result["p50_s"]
+    return result
+
+def _run_e2e(case, runs, budget_s):
+    from enhancer import decode_image, encode_image, run_pipeline
+
+    image = make_image(case["megapixels"], case["channels"], case["dtype"])
+    source = encode_image(image, "PNG", compress_level=1).data
+    del image
+    stages = {"decode": [], "enhance": [], "encode": []}
+
+    def once():
+        start = time.perf_counter()
+        decoded = decode_image(BytesIO(source))
+        decoded_at = time.perf_counter()
+        enhanced = run_pipeline(decoded, E2E_STEPS)
+        enhanced_at = time.perf_counter()
+        export = encode_image(enhanced, case["format"])
+        stages["decode"].append(decoded_at - start)
+        stages["enhance"].append(enhanced_at - decoded_at)
+        stages["encode"].append(time.perf_counter() - enhanced_at)
+        # Large encodes are spooled to a temporary file
+        export.discard()
+
+    result = measure(once, runs, budget_s)
+    result["mp_per_s"] = case["megapixels"] / result["p50_s"]
+    result["stages_p50_s"] = {stage: statistics.median(s) for stage, s in stages.items()}
+    return result
+
+def _history(n, email):
+    start = datetime(2024, 1, 1)
+    techniques = ("Histogram", "Sharpening", "Denoise", "Edge")
+    return [
+        {"technique": techniques[i % len(techniques)],
+         "date": (start + timedelta(minutes=7 * i)).strftime("%Y-%m-%d %H:%M:%S"),
+         "filename": f"scan_{i}.png"}
+        for i in range(n)
+    ]
+
+def _run_store(case, runs, budget_s):
+    # Cost of recording one enhancement for a user who already has `history`
+    # entries: one SQLite transaction vs. rewriting the legacy users.json
+    from enhancer.store import UserStore
+
+    email = "bench@example.com"
+    user = {
+        "first_name": "Bench", "last_name": "User", "dob": "1990-01-01",
+        "password": "x", "join_date": "2024-01-01",
+        "enhancement_count": case["history"],
+        "enhancement_types": ["Histogram", "Sharpening", "Denoise", "Edge"],
+        "enhancement_history": _history(case["history"], email),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "users.json")
+        with open(json_path, "w") as f:
+            json.dump({email: user}, f)
+
+        if case["name"] == "json.save_users":
+            users = {email: user}
+
+            def once():
+                users[email]["enhancement_history"].append(
+                    {"technique": "Histogram", "date": "2025-01-01 00:00:00", "filename": "x.png"}
+                )
+                users[email]["enhancement_count"] += 1
+                with open(json_path, "w") as f:
+                    json.dump(users, f, indent=4)
+
+            return measure(once, runs, budget_s)
+
+        store = UserStore(os.path.join(tmp, "users.db"), legacy_json=json_path)
+        return measure(
+            lambda: store.record_enhancement(email, "Histogram", "x.png"), runs, budget_s
+        )
+
+
+# DRIVER
+
+def _environment():
+    env = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import cv2
+        import numpy as np
+
+        env.update(numpy=np.__version__, opencv=cv2.__version__, opencv_threads=cv2.getNumThreads())
+    except ImportError:
+        pass
+    try:
+        env["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return env
+
+def run_in_child(case, runs, budget_s):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case),
+         "--runs", str(runs), "--case-budget", str(budget_s)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if out.returncode != 0:
+        lines = out.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit status {out.returncode}"}
+    return json.loads(out.stdout)
+
+def _csv(value, cast=str):
+    return [cast(v) for v in value.split(",") if v]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark enhancement techniques, end-to-end path and storage")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="megapixels, comma-separated (e.g. 1,10,100)")
+    parser.add_argument("--channels", default="1,3")
+    parser.add_argument("--dtypes", default="uint8", help="e.g. uint8,uint16")
+    parser.add_argument("--ops", default="", help="operations to run (default: all)")
+    parser.add_argument("--history", default=STORE_HISTORY_SIZES, help="history lengths for the storage cases")
+    parser.add_argument("--only", choices=["operation", "e2e", "store"], action="append",
+                        help="run only these kinds of case (repeatable)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--case-budget", type=float, default=DEFAULT_CASE_BUDGET_S,
+                        help="stop repeating a case after this many seconds")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case), args.runs, args.case_budget)))
+        return 0
+
+    sizes = _csv(args.sizes, float)
+    sizes = [int(mp) if mp == int(mp) else mp for mp in sizes]
+    kinds = args.only or ["operation", "e2e", "store"]
+    cases = []
+    if "operation" in kinds:
+        cases += operation_cases(_csv(args.ops), sizes, _csv(args.channels, int), _csv(args.dtypes))
+    if "e2e" in kinds:
+        cases += e2e_cases(sizes)
+    if "store" in kinds:
+        cases += store_cases(_csv(args.history, int))
+
+    results = []
+    for i, case in enumerate(cases, 1):
+        key = case_key(case)
+        print(f"[{i}/{len(cases)}] {key}", file=sys.stderr)
+        results.append(dict(case, key=key, **run_in_child(case, args.runs, args.case_budget)))
+
+    report = json.dumps({"environment": _environment(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
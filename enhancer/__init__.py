@@ -0,0 +1,32 @@
+# Headless enhancement engine. Importing this package must never pull in
+# streamlit, skimage or matplotlib; see benchmarks/import_time.py.
+
+from enhancer.cache import ResultCache, bytes_key, cached_apply, cached_decode, get_cache
+from enhancer.codec import decode_image, image_to_bytes, to_display, to_rgb_view
+from enhancer.denoise import DENOISE_TIERS, apply_denoise, choose_tier
+from enhancer.export import Export, encode_image, export_image, peek_export
+from enhancer.imagestore import ImageHandle, ImageStore, get_image_store
+from enhancer.jobs import JobQueue, QueueFull, UserLimitReached, get_queue
+from enhancer.metrics import get_metrics
+from enhancer.noise import SaltPepperNoise
+from enhancer.operations import (
+    apply_complement,
+    apply_edge_detection,
+    apply_gaussian_blur,
+    apply_histogram_equalization,
+    apply_salt_and_pepper,
+    apply_sharpening,
+    to_bgr,
+    to_gray,
+)
+from enhancer.pipeline import cached_run_pipeline, run_pipeline
+from enhancer.preview import PREVIEW_MAX_SIDE, make_proxy, preview_pipeline
+from enhancer.registry import (
+    OPERATIONS,
+    Operation,
+    apply_technique,
+    apply_tiled,
+    get_operation,
+    register,
+    technique_labels,
+)
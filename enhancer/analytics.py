@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from io import BytesIO
+
+
+# ANALYTICS CHARTS
+# Rendered from the store's hourly technique and activity buckets, never
+# from raw history, so cost depends on the chosen date window rather than on
+# how long someone has been a user. Both charts cover the same window. PNGs are cached per (user, revision,
+# window) and the revision changes whenever new activity is recorded.
+
+# Windows longer than this are plotted per day instead of per hour
+HOURLY_WINDOW_DAYS = 7
+
+CHART_CACHE_ENTRIES = 256
+
+_chart_cache = OrderedDict()
+_chart_lock = threading.Lock()
+
+def _figure(figsize=(8, 4)):
+    # Figure without pyplot: no global state, safe from several sessions
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=figsize)
+
+def _to_png(fig):
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+def render_technique_chart(counts):
+    fig = _figure()
+    ax = fig.subplots()
+    ax.bar(list(counts.keys()), list(counts.values()), color='#1976d2')
+    ax.set_title('Enhancement Techniques Used')
+    ax.set_ylabel('Count')
+    ax.tick_params(axis='x', labelrotation=45)
+    return _to_png(fig)
+
+def render_timeline_chart(buckets, baseline=0, granularity="hour"):
+    fmt = "%Y-%m-%d" if granularity == "day" else "%Y-%m-%d %H"
+    dates = [datetime.strptime(bucket, fmt) for bucket, _ in buckets]
+    totals = []
+    running = baseline
+    for _, count in buckets:
+        running += count
+        totals.append(running)
+
+    fig = _figure()
+    ax = fig.subplots()
+    ax.plot(dates, totals, marker='o', color='#e53935')
+    ax.set_title('Enhancement Activity Over Time')
+    ax.set_ylabel('Total Enhancements')
+    ax.tick_params(axis='x', labelrotation=45)
+    return _to_png(fig)
+
+def chart_granularity(start, end):
+    if start and end and (end - start).days < HOURLY_WINDOW_DAYS:
+        return "hour"
+    return "day"
+
+def user_charts(store, email, start=None, end=None):
+    # Returns (technique_png, timeline_png); either is None when empty
+    revision = store.revision(email)
+    key = (email, revision, str(start), str(end))
+    with _chart_lock:
+        if key in _chart_cache:
+            _chart_cache.move_to_end(key)
+            return _chart_cache[key]
+
+    counts = store.technique_counts(email, start=start, end=end)
+    granularity = chart_granularity(start, end)
+    buckets = store.activity(email, start=start, end=end, granularity=granularity)
+    baseline = store.activity_before(email, start) if start else 0
+    charts = (
+        render_technique_chart(counts) if counts else None,
+        render_timeline_chart(buckets, baseline, granularity) if buckets else None,
+    )
+
+    with _chart_lock:
+        _chart_cache[key] = charts
+        while len(_chart_cache) > CHART_CACHE_ENTRIES:
+            _chart_cache.popitem(last=False)
+    return charts
@@ -0,0 +1,317 @@
+# Batch/folder enhancement.
+#
+#   python -m enhancer.batch scans/ "more/**/*.tif" -t Histogram -t Denoise -o out/
+#
+# With --chain the techniques run as one pipeline and produce a single output
+# per file instead of one output per technique.
+#
+# Each input file is decoded, enhanced with every requested technique and
+# encoded inside one worker process, so decode, enhance and encode of
+# different files overlap across the pool. At most --max-in-flight files are
+# submitted at a time, which bounds memory no matter how many inputs there are.
+# Outputs are written atomically, so a restarted run skips everything that was
+# already finished.
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp", ".npy")
+# Formats cv2.imwrite can store 16 bits in; the rest would saturate
+DEEP_FORMATS = (".png", ".tif", ".tiff")
+
+
+# INPUT / OUTPUT PATHS
+
+def _glob_root(pattern):
+    # The leading directories of a pattern that contain no wildcards; a plain
+    # file's root is its directory
+    root = os.path.dirname(pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+def collect_inputs(patterns, recursive=False):
+    # Returns (path, relative output stem) pairs. The layout below each input
+    # directory, or below a glob's wildcard-free root, is mirrored under the
+    # output directory. Raises ValueError when two inputs would still write
+    # the same outputs (e.g. two directories that both hold x.png).
+    seen = set()
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                walker = (
+                    (root, name)
+                    for root, _, names in os.walk(pattern)
+                    for name in names
+                )
+            else:
+                walker = ((pattern, name) for name in os.listdir(pattern))
+            found = [
+                (os.path.join(root, name), os.path.relpath(os.path.join(root, name), pattern))
+                for root, name in walker
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+        else:
+            root = _glob_root(pattern)
+            found = [
+                (path, os.path.relpath(path, root))
+                for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path)
+            ]
+        for path, rel in sorted(found):
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                inputs.append((path, os.path.splitext(rel)[0]))
+
+    # Different extensions share a stem too, since every output has one format
+    by_stem = {}
+    for path, stem in inputs:
+        by_stem.setdefault(os.path.normcase(os.path.normpath(stem)), []).append(path)
+    clashes = [paths for paths in by_stem.values() if len(paths) > 1]
+    if clashes:
+        listed = "; ".join(", ".join(paths) for paths in clashes[:5])
+        raise ValueError(f"{len(clashes)} group(s) of inputs would write the same outputs: {listed}")
+    return inputs
+
+def output_path(output_dir, stem, steps, fmt):
+    suffix = "-".join(step.lower() for step in steps)
+    return os.path.join(output_dir, f"{stem}_{suffix}.{fmt.lower()}")
+
+def build_jobs(inputs, recipes, output_dir, fmt, overwrite=False, tile_size=None, params=None):
+    # `recipes` is a list of technique tuples; each tuple is one output.
+    # `params` maps a technique name to keyword arguments for it.
+    jobs = []
+    skipped = []
+    for path, stem in inputs:
+        targets = [
+            (steps, output_path(output_dir, stem, steps, fmt))
+            for steps in recipes
+        ]
+        if not overwrite:
+            targets = [t for t in targets if not os.path.exists(t[1])]
+        if targets:
+            jobs.append((path, targets, tile_size, params or {}))
+        else:
+            skipped.append(path)
+    return jobs, skipped
+
+
+# WORKER
+
+def _init_worker():
+    import cv2
+
+    # One process per core already; don't let OpenCV fan out on top of that
+    cv2.setNumThreads(1)
+
+def _write_atomic(path, image):
+    import cv2
+
+    from enhancer.operations import to_uint8
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    root, ext = os.path.splitext(path)
+    if ext.lower() not in DEEP_FORMATS:
+        image = to_uint8(image)
+    tmp_path = f"{root}.{os.getpid()}.part{ext}"
+    if not cv2.imwrite(tmp_path, image):
+        raise IOError(f"Could not encode {path}")
+    os.replace(tmp_path, path)
+
+def process_file(job):
+    from enhancer.codec import decode_image
+    from enhancer.pipeline import run_pipeline
+    from enhancer.registry import apply_technique, apply_tiled
+
+    path, targets, tile_size, params = job
+    stats = {"path": path, "outputs": [], "decode_s": 0.0, "enhance_s": 0.0, "encode_s": 0.0}
+    try:
+        start = time.perf_counter()
+        image = decode_image(path)
+        stats["decode_s"] = time.perf_counter() - start
+        stats["height"], stats["width"] = image.shape[:2]
+
+        for steps, out_path in targets:
+            start = time.perf_counter()
+            if len(steps) > 1:
+                result = run_pipeline(image, [(step, params.get(step, {})) for step in steps])
+            elif tile_size:
+                result = apply_tiled(steps[0], image, tile_size=tile_size, **params.get(steps[0], {}))
+            else:
+                result = apply_technique(steps[0], image, **params.get(steps[0], {}))
+            stats["enhance_s"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            _write_atomic(out_path, result)
+            stats["encode_s"] += time.perf_counter() - start
+            stats["outputs"].append(out_path)
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+    return stats
+
+
+# POOL
+
+def iter_results(jobs, workers=None, max_in_flight=None, ordered=True):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or 2 * workers)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        jobs = iter(enumerate(jobs))
+        in_flight = {}
+        finished = {}
+        next_index = 0
+        exhausted = False
+
+        while in_flight or finished or not exhausted:
+            # In ordered mode completed results wait in `finished` until their
+            # turn, so they count against the in-flight budget too
+            while not exhausted and len(in_flight) + len(finished) < max_in_flight:
+                try:
+                    index, job = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight[pool.submit(process_file, job)] = index
+
+            if ordered:
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+            if not in_flight:
+                continue
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                if ordered:
+                    finished[index] = future.result()
+                else:
+                    yield future.result()
+
+
+# REPORTING
+
+def format_file_stats(stats):
+    if "error" in stats:
+        return f"FAILED  {stats['path']}: {stats['error']}"
+    megapixels = stats["width"] * stats["height"] / 1e6
+    total = stats["decode_s"] + stats["enhance_s"] + stats["encode_s"]
+    rate = megapixels * len(stats["outputs"]) / total if total else 0.0
+    return (
+        f"ok      {stats['path']}  {stats['width']}x{stats['height']}  "
+        f"decode {stats['decode_s']:.3f}s  enhance {stats['enhance_s']:.3f}s  "
+        f"encode {stats['encode_s']:.3f}s  {rate:.2f} MP/s"
+    )
+
+def summarize(results, skipped, wall_s, workers):
+    ok = [r for r in results if "error" not in r]
+    megapixels = sum(r["width"] * r["height"] * len(r["outputs"]) for r in ok) / 1e6
+    return {
+        "files": len(results) + len(skipped),
+        "processed": len(ok),
+        "failed": len(results) - len(ok),
+        "skipped": len(skipped),
+        "outputs_written": sum(len(r["outputs"]) for r in ok),
+        "workers": workers,
+        "wall_s": wall_s,
+        "megapixels": megapixels,
+        "mp_per_s": megapixels / wall_s if wall_s else 0.0,
+        "files_per_s": len(ok) / wall_s if wall_s else 0.0,
+        "decode_s": sum(r["decode_s"] for r in ok),
+        "enhance_s": sum(r["enhance_s"] for r in ok),
+        "encode_s": sum(r["encode_s"] for r in ok),
+    }
+
+
+# CLI
+
+def main(argv=None):
+    from enhancer.registry import get_operation
+
+    parser = argparse.ArgumentParser(description="Enhance a folder or glob of images in parallel")
+    parser.add_argument("inputs", nargs="+", help="directories, files or glob patterns")
+    parser.add_argument("-t", "--technique", action="append", required=True,
+                        help="technique name, e.g. Histogram or Denoise (repeatable)")
+    parser.add_argument("--chain", action="store_true",
+                        help="apply the techniques in order as one pipeline with a single output")
+    parser.add_argument("--denoise-tier", default="quality",
+                        choices=["auto", "fast", "balanced", "quality", "parallel"],
+                        help="speed/quality trade-off for Denoise (see enhancer/denoise.py)")
+    parser.add_argument("--noise-amount", type=float, default=0.05,
+                        help="fraction of pixels Salt replaces")
+    parser.add_argument("--salt-vs-pepper", type=float, default=0.5,
+                        help="share of Salt's replaced pixels that turn white rather than black")
+    parser.add_argument("--noise-seed", type=int, default=None,
+                        help="seed Salt for reproducible noise")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("-f", "--format", default="png", choices=["png", "jpg", "webp", "tiff", "bmp"])
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into sub-folders")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="files submitted but not yet reported (default: 2 x workers)")
+    parser.add_argument("--unordered", action="store_true", help="report files as they finish")
+    parser.add_argument("--overwrite", action="store_true", help="redo outputs that already exist")
+    parser.add_argument("--tile-size", type=int, default=None,
+                        help="process in tiles of this many pixels to bound memory on huge images")
+    parser.add_argument("--report", help="write the per-file stats and summary as JSON to this path")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        techniques = [get_operation(t).name for t in args.technique]
+    except KeyError as e:
+        parser.error(str(e))
+    if args.chain and args.tile_size:
+        parser.error("--chain cannot be combined with --tile-size")
+    recipes = [tuple(techniques)] if args.chain else [(t,) for t in techniques]
+
+    try:
+        inputs = collect_inputs(args.inputs, recursive=args.recursive)
+    except ValueError as e:
+        parser.error(str(e))
+    if not inputs:
+        parser.error("no input images found")
+    jobs, skipped = build_jobs(
+        inputs, recipes, args.output, args.format,
+        overwrite=args.overwrite, tile_size=args.tile_size,
+        params={
+            "Denoise": {"tier": args.denoise_tier},
+            "Salt": {
+                "amount": args.noise_amount,
+                "salt_vs_pepper": args.salt_vs_pepper,
+                "seed": args.noise_seed,
+            },
+        }
+    )
+    if skipped and not args.quiet:
+        print(f"resume: skipping {len(skipped)} file(s) with all outputs present", file=sys.stderr)
+
+    start = time.perf_counter()
+    results = []
+    for stats in iter_results(jobs, args.workers, args.max_in_flight, ordered=not args.unordered):
+        results.append(stats)
+        if not args.quiet or "error" in stats:
+            print(format_file_stats(stats), flush=True)
+    summary = summarize(results, skipped, time.perf_counter() - start, args.workers)
+
+    print(
+        f"{summary['processed']} processed, {summary['skipped']} skipped, "
+        f"{summary['failed']} failed in {summary['wall_s']:.2f}s "
+        f"({summary['mp_per_s']:.2f} MP/s, {summary['files_per_s']:.2f} files/s)"
+    )
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"summary": summary, "files": results}, f, indent=4)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+
+from enhancer.codec import decode_image
+from enhancer.metrics import get_metrics, tally
+from enhancer.registry import get_operation, is_cacheable
+
+
+# RESULT CACHE
+# Decoded uploads and enhancement results keyed by content hash, so a rerun or
+# a second session working on the same image never recomputes. The memory tier
+# is an LRU bounded by total array bytes; the optional disk tier stores .npy
+# files and survives restarts. Cached arrays are returned read-only.
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def bytes_key(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+def image_key(image):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{image.shape}|{image.dtype}|".encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+def result_key(source_key, technique, params=None):
+    spec = json.dumps(params or {}, sort_keys=True, default=str)
+    return bytes_key(f"{source_key}|{technique}|{spec}".encode())
+
+
+class ResultCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "misses": 0, "evictions": 0,
+            "disk_hits": 0, "disk_writes": 0, "disk_evictions": 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return value
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key, value):
+        value.setflags(write=False)
+        with self._lock:
+            self._insert(key, value)
+        self._write_disk(key, value)
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        tally("cache_hits" if value is not None else "cache_misses")
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = self._counters["hits"] + self._counters["disk_hits"]
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                hit_ratio=hits / lookups if lookups else 0.0,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _insert(self, key, value):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).nbytes
+        if value.nbytes > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._bytes += value.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self._counters["evictions"] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            value = np.load(path)
+            # Pruning removes the least recently used files first
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        value.setflags(write=False)
+        return value
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp_path, "wb") as f:
+            np.save(f, value)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._counters["disk_writes"] += 1
+        if self.max_disk_bytes:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".npy"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._counters["disk_evictions"] += 1
+
+
+# PROCESS-WIDE CACHE
+# One instance per process so every Streamlit session shares it. Sized from
+# ENHANCER_CACHE_MB / ENHANCER_CACHE_DIR / ENHANCER_CACHE_DISK_MB.
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            max_mb = float(os.environ.get("ENHANCER_CACHE_MB", DEFAULT_MAX_BYTES / 2**20))
+            disk_mb = os.environ.get("ENHANCER_CACHE_DISK_MB")
+            _default_cache = ResultCache(
+                max_bytes=int(max_mb * 2**20),
+                disk_dir=os.environ.get("ENHANCER_CACHE_DIR") or None,
+                max_disk_bytes=int(float(disk_mb) * 2**20) if disk_mb else None,
+            )
+            get_metrics().register_collector(
+                lambda: {f"cache_{k}": v for k, v in _default_cache.stats().items()}
+            )
+        return _default_cache
+
+def cached_decode(data, cache=None):
+    cache = cache or get_cache()
+    return cache.get_or_compute(
+        result_key(bytes_key(data), "decode", {"native": True}),
+        lambda: decode_image(BytesIO(data))
+    )
+
+def cached_apply(technique, image, source_key=None, cache=None, **params):
+    operation = get_operation(technique)
+    if not is_cacheable(operation, params):
+        return operation.func(image, **params)
+    cache = cache or get_cache()
+    key = result_key(source_key or image_key(image), operation.name, params)
+    return cache.get_or_compute(key, lambda: operation.func(image, **params))
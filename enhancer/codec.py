@@ -0,0 +1,50 @@
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from enhancer.metrics import stage
+from enhancer.operations import to_uint8
+
+
+# DECODING / ENCODING
+# Gray scans decode to one uint8 or uint16 channel instead of being expanded
+# to 8-bit RGB; everything else decodes to 8-bit BGR.
+
+GRAY_MODES = ("1", "L", "LA", "La")
+GRAY_16BIT_MODES = ("I;16", "I;16L", "I;16B", "I;16N", "I")
+
+def decode_image(source):
+    # Pre-decoded arrays are memory-mapped rather than read, which is how very
+    # large scans are fed to tiled processing without loading them
+    if isinstance(source, str) and source.lower().endswith(".npy"):
+        return np.load(source, mmap_mode="r")
+    with stage("decode") as span:
+        image = source if isinstance(source, Image.Image) else Image.open(source)
+        if image.mode in GRAY_16BIT_MODES:
+            image_np = np.asarray(image)
+            if image.mode == "I":
+                # 32-bit; this is how Pillow opens 16-bit PNGs
+                image_np = np.clip(image_np, 0, 65535)
+            return span.record(image_np.astype(np.uint16), format=image.format)
+        if image.mode in GRAY_MODES:
+            return span.record(np.array(image.convert("L")), format=image.format)
+        image_np = span.record(np.array(image.convert("RGB")), format=image.format)
+    with stage("convert", to="bgr") as span:
+        return span.record(cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR))
+
+def to_rgb_view(image):
+    # Channel-reversed view for RGB consumers (PIL, the comparison widget);
+    # no pixels are copied
+    return image if image.ndim == 2 else image[:, :, ::-1]
+
+def to_display(image):
+    # What st.image and the comparison widget get: 8-bit, RGB order, gray
+    # left as one channel (both widgets accept it)
+    return to_rgb_view(to_uint8(image))
+
+def image_to_bytes(image, format):
+    buf = BytesIO()
+    image.save(buf, format=format)
+    return buf.getvalue()
@@ -0,0 +1,136 @@
+import json
+import math
+import os
+import statistics
+
+import cv2
+import numpy as np
+
+from enhancer.tiling import run_tiled
+
+
+# DENOISE TIERS
+#
+#   tier       method                                    default ms / MP
+#   fast       bilateral filter, d=5                                    90
+#   balanced   NL-means, 5px template / 11px search                  1190
+#   quality    NL-means, 7px template / 21px search (original)       3290
+#   parallel   quality, tiled across all cores                       3290
+#
+# Costs are for a 3-channel uint8 image. balanced and quality are the
+# measurements in benchmarks/denoise_baseline.json. fast wasn't measured; it
+# is the fallback "auto" never weighs against the budget. OpenCV already
+# spreads NL-means over its own thread pool, so tiling across cores isn't
+# assumed to be any faster: "parallel" costs the same as quality until it is
+# measured. To tune "auto" for a machine, measure each tier with
+#
+#   python benchmarks/suite.py --only operation --ops Denoise --channels 3 -o denoise.json
+#
+# and set ENHANCER_DENOISE_COSTS=denoise.json. The median ms/MP over the
+# report's sizes then replaces the default for every tier it covers. "auto"
+# picks the best tier whose estimate fits `budget_s` (DEFAULT_BUDGET_S by
+# default).
+# Gray images are denoised as one channel and uint16 keeps its depth: NL-means
+# runs with the L1 norm OpenCV requires for 16-bit, and the bilateral filter,
+# which is 8-bit/float only, goes through float32. Strengths are given in
+# 8-bit units and scaled to the image's range.
+#
+# `scale` < 1 means the image is a downscaled preview: windows shrink with it,
+# and "auto" estimates for the full-resolution image so the preview uses the
+# same tier the final render will.
+
+DENOISE_TIERS = ("fast", "balanced", "quality", "parallel")
+DEFAULT_TIER_MS_PER_MP = {"fast": 90, "balanced": 1190, "quality": 3290, "parallel": 3290}
+DEFAULT_BUDGET_S = 2.0
+
+# Search radius + template radius of the widest tier; tiles need this much
+# context to match the untiled result
+DENOISE_HALO = 7 // 2 + 21 // 2
+
+def tier_costs_from_report(path):
+    # ms/MP per tier from a benchmarks/suite.py report (3-channel uint8 cases)
+    with open(path) as f:
+        results = json.load(f)["results"]
+    samples = {}
+    for r in results:
+        if (r.get("kind") == "operation" and r.get("name") == "Denoise" and r.get("mp_per_s")
+                and r.get("channels") == 3 and r.get("dtype") == "uint8"):
+            samples.setdefault(r["params"]["tier"], []).append(1000 / r["mp_per_s"])
+    return {tier: statistics.median(costs) for tier, costs in samples.items()}
+
+def _load_tier_costs():
+    costs = dict(DEFAULT_TIER_MS_PER_MP)
+    path = os.environ.get("ENHANCER_DENOISE_COSTS")
+    if path:
+        costs.update(tier_costs_from_report(path))
+    return costs
+
+TIER_MS_PER_MP = _load_tier_costs()
+
+def _cores():
+    return os.cpu_count() or 1
+
+def estimate_seconds(tier, image, scale=1.0):
+    megapixels = image.shape[0] * image.shape[1] / 1e6 / scale ** 2
+    return megapixels * TIER_MS_PER_MP[tier] / 1000
+
+def choose_tier(image, budget_s=DEFAULT_BUDGET_S, scale=1.0):
+    candidates = ["quality", "parallel", "balanced"] if _cores() > 1 else ["quality", "balanced"]
+    for tier in candidates:
+        if estimate_seconds(tier, image, scale) <= budget_s:
+            return tier
+    return "fast"
+
+def _scaled_window(size, scale, minimum):
+    return max(minimum, int(round(size * scale)) | 1)
+
+def _range_scale(image):
+    return np.iinfo(image.dtype).max / 255
+
+def _nl_means(image, out=None, template=7, search=21, scale=1.0):
+    template = _scaled_window(template, scale, 3)
+    search = _scaled_window(search, scale, template)
+    if image.dtype != np.uint8:
+        return cv2.fastNlMeansDenoising(
+            image, dst=out, h=[10 * _range_scale(image)], templateWindowSize=template,
+            searchWindowSize=search, normType=cv2.NORM_L1
+        )
+    if image.ndim == 2:
+        return cv2.fastNlMeansDenoising(image, out, 10, template, search)
+    return cv2.fastNlMeansDenoisingColored(image, out, 10, 10, template, search)
+
+def _bilateral(image, out=None, diameter=5, scale=1.0):
+    if image.dtype == np.uint8:
+        return cv2.bilateralFilter(image, diameter, 50, 50 * scale, dst=out)
+    filtered = cv2.bilateralFilter(image.astype(np.float32), diameter, 50 * _range_scale(image), 50 * scale)
+    if out is None:
+        out = np.empty_like(image)
+    np.copyto(out, np.rint(filtered, out=filtered), casting="unsafe")
+    return out
+
+def _parallel_nl_means(image, out=None):
+    workers = _cores()
+    height, width = image.shape[:2]
+    # At least two tiles per core so a slow tile doesn't leave cores idle
+    tile_size = max(256, math.ceil(math.sqrt(height * width / (2 * workers))))
+    return run_tiled(
+        _nl_means, image, halo=DENOISE_HALO, tile_size=tile_size,
+        out=out, workers=workers
+    )
+
+def denoise(image, out=None, tier="quality", budget_s=None, scale=1.0):
+    if tier == "auto":
+        tier = choose_tier(image, budget_s or DEFAULT_BUDGET_S, scale)
+    if tier == "fast":
+        return _bilateral(image, out, _scaled_window(5, scale, 1), scale)
+    if tier == "balanced":
+        return _nl_means(image, out, template=5, search=11, scale=scale)
+    if tier == "parallel" and scale == 1.0:
+        return _parallel_nl_means(image, out)
+    if tier in ("quality", "parallel"):
+        # A preview proxy is small enough that splitting it isn't worth it
+        return _nl_means(image, out, scale=scale)
+    raise ValueError(f"Unknown denoise tier: {tier}")
+
+def apply_denoise(image, tier="quality", budget_s=None, scale=1.0):
+    return denoise(image, tier=tier, budget_s=budget_s, scale=scale)
@@ -0,0 +1,211 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from enhancer.metrics import stage
+from enhancer.operations import to_uint8
+
+
+# EXPORT ENCODING
+# Encoding only happens when an export is requested, and each
+# (result, format, settings) combination is encoded once and memoized. BGR
+# arrays are handed to Pillow through its "BGR" raw mode, so no RGB copy is
+# made. Images whose raw size exceeds SPOOL_THRESHOLD_BYTES are encoded
+# straight into a temporary file, and consumers stream it with chunks() rather
+# than holding it in memory. 16-bit gray keeps its depth in PNG (and TIFF
+# stacks, see enhancer/stream.py); other formats get 8 bits.
+#
+# peek_export() and export_image() return the export pinned: the memo may
+# evict it at any time, but its spooled file stays until every holder has
+# called release() (or left a `with export:` block).
+
+FORMATS = {
+    "PNG": {"extension": "png", "mime": "image/png"},
+    "JPEG": {"extension": "jpg", "mime": "image/jpeg"},
+    "WEBP": {"extension": "webp", "mime": "image/webp"},
+}
+
+# Pillow's own defaults, spelled out so the UI can show and tune them
+DEFAULT_SETTINGS = {
+    "PNG": {"compress_level": 6},
+    "JPEG": {"quality": 75, "optimize": False, "progressive": False},
+    "WEBP": {"quality": 80, "method": 4, "lossless": False},
+}
+
+SPOOL_THRESHOLD_BYTES = 64 * 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+# In-memory encodings kept around; spilled ones only cost disk
+MEMO_MAX_BYTES = 128 * 1024 * 1024
+MEMO_MAX_ENTRIES = 64
+
+
+@dataclass
+class Export:
+    format: str
+    settings: dict
+    size: int
+    encode_s: float
+    data: bytes = None
+    path: str = None
+    _refs: int = field(default=0, repr=False, compare=False)
+    _discarded: bool = field(default=False, repr=False, compare=False)
+
+    @property
+    def mime(self):
+        return FORMATS[self.format]["mime"]
+
+    @property
+    def extension(self):
+        return FORMATS[self.format]["extension"]
+
+    def open(self):
+        return open(self.path, "rb") if self.path else BytesIO(self.data)
+
+    def chunks(self, chunk_bytes=CHUNK_BYTES):
+        with self.open() as f:
+            while True:
+                chunk = f.read(chunk_bytes)
+                if not chunk:
+                    return
+                yield chunk
+
+    def pin(self):
+        with _pin_lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with _pin_lock:
+            self._refs -= 1
+            remove = self._discarded and self._refs <= 0
+        if remove:
+            self._remove()
+
+    def discard(self):
+        # The spooled file goes once nobody is serving it any more
+        with _pin_lock:
+            self._discarded = True
+            remove = self._refs <= 0
+        if remove:
+            self._remove()
+
+    def _remove(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+_pin_lock = threading.Lock()
+
+
+def normalize_format(fmt):
+    fmt = fmt.upper()
+    fmt = {"JPG": "JPEG"}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return fmt
+
+def export_settings(fmt, **overrides):
+    settings = dict(DEFAULT_SETTINGS[normalize_format(fmt)])
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return settings
+
+def to_pil(image, fmt="PNG"):
+    if not (fmt in ("PNG", "TIFF") and image.ndim == 2 and image.dtype == np.uint16):
+        image = to_uint8(image)
+    image = np.ascontiguousarray(image)
+    height, width = image.shape[:2]
+    if image.dtype == np.uint16:
+        return Image.frombuffer("I;16", (width, height), image, "raw", "I;16", 0, 1)
+    if image.ndim == 2:
+        return Image.frombuffer("L", (width, height), image, "raw", "L", 0, 1)
+    return Image.frombuffer("RGB", (width, height), image, "raw", "BGR", 0, 1)
+
+def encode(image, fmt, fileobj, **settings):
+    fmt = normalize_format(fmt)
+    to_pil(image, fmt).save(fileobj, format=fmt, **export_settings(fmt, **settings))
+
+def encode_image(image, fmt, **settings):
+    fmt = normalize_format(fmt)
+    settings = export_settings(fmt, **settings)
+    with stage("encode", format=fmt) as span:
+        span.record(image)
+        start = time.perf_counter()
+        if image.nbytes > SPOOL_THRESHOLD_BYTES:
+            fd, path = tempfile.mkstemp(prefix="enhancer-export-", suffix="." + FORMATS[fmt]["extension"])
+            with os.fdopen(fd, "wb") as f:
+                encode(image, fmt, f, **settings)
+            export = Export(fmt, settings, os.path.getsize(path), time.perf_counter() - start, path=path)
+        else:
+            buf = BytesIO()
+            encode(image, fmt, buf, **settings)
+            data = buf.getvalue()
+            export = Export(fmt, settings, len(data), time.perf_counter() - start, data=data)
+        span.record(encoded_bytes=export.size)
+        return export
+
+
+# MEMOIZED EXPORTS
+
+_memo = OrderedDict()
+_memo_bytes = 0
+_memo_lock = threading.Lock()
+
+def _memo_key(result_key, fmt, settings):
+    return (result_key, fmt, tuple(sorted(settings.items())))
+
+def peek_export(result_key, fmt, **settings):
+    # Pinned; release() it when done
+    fmt = normalize_format(fmt)
+    key = _memo_key(result_key, fmt, export_settings(fmt, **settings))
+    with _memo_lock:
+        export = _memo.get(key)
+        if export is not None:
+            _memo.move_to_end(key)
+            export.pin()
+        return export
+
+def export_image(image, result_key, fmt, **settings):
+    # `result_key` identifies the pixels (e.g. a cache key or job id). Pinned;
+    # release() it when done
+    export = peek_export(result_key, fmt, **settings)
+    if export is not None:
+        return export
+    export = encode_image(image, fmt, **settings)
+    return _remember(_memo_key(result_key, export.format, export.settings), export)
+
+def _remember(key, export):
+    global _memo_bytes
+    evicted = []
+    with _memo_lock:
+        if key in _memo:
+            # Another session encoded the same thing concurrently; keep theirs
+            evicted.append(export)
+            export = _memo[key]
+        else:
+            _memo[key] = export
+            _memo_bytes += len(export.data or b"")
+        export.pin()
+        while len(_memo) > MEMO_MAX_ENTRIES or _memo_bytes > MEMO_MAX_BYTES:
+            _, old = _memo.popitem(last=False)
+            _memo_bytes -= len(old.data or b"")
+            evicted.append(old)
+    for old in evicted:
+        old.discard()
+    return export
@@ -0,0 +1,291 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from enhancer.codec import to_display
+from enhancer.metrics import get_metrics
+from enhancer.preview import PREVIEW_MAX_SIDE, make_proxy
+
+
+# IMAGE STORE
+# Full-resolution images that sessions are working on (uploads and rendered
+# results) live here, once per process, instead of in each session's state.
+# A session keeps an ImageHandle: the content key plus shape and dtype. Two
+# sessions uploading the same file share one entry.
+#
+# Entries are kept in least-recently-used order. Once the arrays held in memory
+# exceed `max_bytes`, the coldest are spilled: written to an .npy file and
+# replaced by a read-only memory map of it, which the OS pages in on demand.
+# Entries idle for `idle_s` are spilled too. Past `max_disk_bytes` the coldest
+# spilled entries are dropped; get() then returns None and the caller decodes
+# or renders again.
+#
+# display() gives the 8-bit RGB derivative the browser widgets get, sized to
+# the comparison viewer. It's made once per entry and counts against
+# `max_bytes` like the arrays do: spilling an entry drops its display, and a
+# display later rebuilt for a spilled entry is dropped in the same LRU order.
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 8 * 1024 * 1024 * 1024
+DEFAULT_IDLE_S = 300.0
+
+DISPLAY_MAX_SIDE = PREVIEW_MAX_SIDE
+
+
+@dataclass(frozen=True)
+class ImageHandle:
+    key: str
+    shape: tuple
+    dtype: str
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+
+class _Entry:
+    def __init__(self, handle, image):
+        self.handle = handle
+        self.image = image
+        self.path = None
+        self.spilling = False
+        self.display = None
+        self.display_bytes = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+
+class ImageStore:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_dir=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES, idle_s=DEFAULT_IDLE_S):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.idle_s = idle_s
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="enhancer-images-")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"puts": 0, "dedup_hits": 0, "spills": 0, "evictions": 0, "display_renders": 0}
+
+    def put(self, key, image):
+        # Keeps a reference to `image` (made read-only) rather than a copy
+        with self._lock:
+            entry = self._touch(key)
+            if entry is not None:
+                self._counters["dedup_hits"] += 1
+                return entry.handle
+            image.setflags(write=False)
+            handle = ImageHandle(key, tuple(image.shape), str(image.dtype))
+            self._entries[key] = _Entry(handle, image)
+            self._memory_bytes += image.nbytes
+            self._counters["puts"] += 1
+        self._spill_cold()
+        return handle
+
+    def get_or_put(self, key, compute):
+        # `compute` only runs when the key isn't stored yet
+        handle = self.handle(key)
+        if handle is not None:
+            with self._lock:
+                self._counters["dedup_hits"] += 1
+            return handle
+        return self.put(key, compute())
+
+    def handle(self, key):
+        with self._lock:
+            entry = self._touch(key)
+            return entry.handle if entry is not None else None
+
+    def get(self, handle):
+        # The full-resolution array (possibly memory-mapped), or None if evicted
+        with self._lock:
+            entry = self._touch(handle.key)
+            image = entry.image if entry is not None else None
+        self._spill_cold()
+        return image
+
+    def display(self, handle, max_side=DISPLAY_MAX_SIDE):
+        with self._lock:
+            entry = self._touch(handle.key)
+            if entry is None:
+                return None
+            if entry.display is not None:
+                return entry.display
+            image = entry.image
+        display = to_display(make_proxy(image, max_side)[0])
+        display.setflags(write=False)
+        with self._lock:
+            # Skip the bookkeeping if the entry was dropped in the meantime
+            if entry.display is None and self._entries.get(handle.key) is entry:
+                entry.display = display
+                # A small 8-bit image is its own display; that costs nothing extra
+                entry.display_bytes = 0 if np.may_share_memory(display, image) else display.nbytes
+                self._memory_bytes += entry.display_bytes
+                self._counters["display_renders"] += 1
+            display = entry.display if entry.display is not None else display
+        self._spill_cold()
+        return display
+
+    def discard(self, handle):
+        with self._lock:
+            entry = self._entries.pop(handle.key, None)
+            if entry is not None:
+                self._forget(entry)
+
+    def stats(self):
+        with self._lock:
+            spilled = sum(1 for e in self._entries.values() if not e.in_memory)
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                spilled_entries=spilled,
+                memory_bytes=self._memory_bytes,
+                max_bytes=self.max_bytes,
+                disk_bytes=self._disk_bytes,
+                max_disk_bytes=self.max_disk_bytes,
+            )
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            for entry in entries:
+                self._forget(entry)
+
+    def close(self):
+        self.clear()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+        return entry
+
+    def _forget(self, entry):
+        # Called with the lock held, after removing the entry
+        self._memory_bytes -= entry.display_bytes
+        if entry.in_memory:
+            self._memory_bytes -= entry.image.nbytes
+        else:
+            self._disk_bytes -= entry.image.nbytes
+            try:
+                # An open memory map keeps the data readable until released
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    # SPILLING
+
+    def _spill_cold(self):
+        while True:
+            with self._lock:
+                entry = self._next_to_spill()
+                if entry is None:
+                    break
+                if not entry.in_memory:
+                    # Only its display is left in memory
+                    self._drop_display(entry)
+                    continue
+                entry.spilling = True
+            if not self._spill(entry):
+                break
+        self._evict_disk()
+
+    def _next_to_spill(self):
+        over = self._memory_bytes > self.max_bytes
+        idle_before = time.monotonic() - self.idle_s
+        for entry in self._entries.values():
+            if entry.spilling or not (entry.in_memory or entry.display is not None):
+                continue
+            if over or entry.last_used < idle_before:
+                return entry
+            # Oldest first, so everything after this was used more recently
+            return None
+        return None
+
+    def _spill(self, entry):
+        path = os.path.join(self.spill_dir, f"{entry.handle.key}.npy")
+        tmp_path = f"{path}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, entry.image)
+            os.replace(tmp_path, path)
+            mapped = np.load(path, mmap_mode="r").view(np.ndarray)
+        except OSError:
+            # Out of disk space, say: the entry just stays in memory
+            for leftover in (tmp_path, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            with self._lock:
+                entry.spilling = False
+            return False
+        with self._lock:
+            entry.spilling = False
+            if self._entries.get(entry.handle.key) is not entry:
+                # Discarded while it was being written
+                os.remove(path)
+                return True
+            self._memory_bytes -= entry.image.nbytes
+            self._disk_bytes += entry.image.nbytes
+            entry.image = mapped
+            entry.path = path
+            self._drop_display(entry)
+            self._counters["spills"] += 1
+        return True
+
+    def _drop_display(self, entry):
+        # Called with the lock held; display() rebuilds it when next needed
+        self._memory_bytes -= entry.display_bytes
+        entry.display = None
+        entry.display_bytes = 0
+
+    def _evict_disk(self):
+        with self._lock:
+            while self._disk_bytes > self.max_disk_bytes:
+                key = next((k for k, e in self._entries.items() if not e.in_memory), None)
+                if key is None:
+                    break
+                self._forget(self._entries.pop(key))
+                self._counters["evictions"] += 1
+
+
+# PROCESS-WIDE STORE
+# Shared by every session. Sized from ENHANCER_IMAGE_STORE_MB /
+# ENHANCER_IMAGE_STORE_DIR / ENHANCER_IMAGE_STORE_DISK_MB / ENHANCER_IMAGE_IDLE_S.
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_image_store():
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            max_mb = float(os.environ.get("ENHANCER_IMAGE_STORE_MB", DEFAULT_MAX_BYTES / 2**20))
+            disk_mb = float(os.environ.get("ENHANCER_IMAGE_STORE_DISK_MB", DEFAULT_MAX_DISK_BYTES / 2**20))
+            _default_store = ImageStore(
+                max_bytes=int(max_mb * 2**20),
+                spill_dir=os.environ.get("ENHANCER_IMAGE_STORE_DIR") or None,
+                max_disk_bytes=int(disk_mb * 2**20),
+                idle_s=float(os.environ.get("ENHANCER_IMAGE_IDLE_S", DEFAULT_IDLE_S)),
+            )
+            get_metrics().register_collector(
+                lambda: {f"image_store_{k}": v for k, v in _default_store.stats().items()}
+            )
+        return _default_store
@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from enhancer.metrics import get_metrics
+
+
+# JOB QUEUE
+# Enhancements run on a bounded thread pool (OpenCV releases the GIL) instead
+# of inside the Streamlit script run. Callers get a Job back immediately and
+# poll or wait on it. Submissions are refused once `workers + max_pending`
+# jobs are outstanding, or when a user already has `per_user_limit` jobs
+# queued or running, so one heavy user can't starve the others.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Finished jobs are kept this long for their owner to collect
+JOB_TTL_S = 600
+
+# Recent wait/run times kept for the percentile metrics
+METRIC_SAMPLES = 500
+
+
+# The job running on each worker thread, for cancel_requested()
+_current = threading.local()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UserLimitReached(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, user, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self._future = None
+        self._event = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def wait_s(self):
+        if self.started_at is None:
+            return time.time() - self.submitted_at
+        return self.started_at - self.submitted_at
+
+
+class JobQueue:
+    def __init__(self, workers=None, max_pending=None, per_user_limit=2):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending if max_pending is not None else 4 * self.workers
+        self.per_user_limit = per_user_limit
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="enhance")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wait_samples = deque(maxlen=METRIC_SAMPLES)
+        self._run_samples = deque(maxlen=METRIC_SAMPLES)
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    def submit(self, user, func, *args, **kwargs):
+        with self._lock:
+            self._check_capacity(user)
+            job = Job(user, func, args, kwargs)
+            self._jobs[job.id] = job
+            self._counters["submitted"] += 1
+            job._future = self._pool.submit(self._run, job)
+        return job
+
+    def check_capacity(self, user=None):
+        # Raises what submit() would, without submitting, so callers can turn
+        # work away before doing anything expensive to prepare it
+        with self._lock:
+            self._check_capacity(user)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # Queued jobs never start; a running job can't be interrupted inside
+        # OpenCV, so it finishes but its result is dropped
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancel_requested = True
+            if job._future.cancel():
+                self._finish(job, CANCELLED)
+            return True
+
+    def position(self, job_id):
+        # How many jobs were queued ahead of this one; 0 once it is running
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return 0
+            return sum(
+                1 for j in self._jobs.values()
+                if j.status == QUEUED and j.submitted_at < job.submitted_at
+            )
+
+    def metrics(self):
+        with self._lock:
+            queued = sum(j.status == QUEUED for j in self._jobs.values())
+            running = sum(j.status == RUNNING for j in self._jobs.values())
+            waits = sorted(self._wait_samples)
+            runs = sorted(self._run_samples)
+            oldest = min(
+                (j.submitted_at for j in self._jobs.values() if j.status == QUEUED),
+                default=None,
+            )
+            return dict(
+                self._counters,
+                workers=self.workers,
+                max_pending=self.max_pending,
+                per_user_limit=self.per_user_limit,
+                queued=queued,
+                running=running,
+                oldest_queued_s=time.time() - oldest if oldest else 0.0,
+                wait_p50_s=_percentile(waits, 0.5),
+                wait_p95_s=_percentile(waits, 0.95),
+                wait_max_s=waits[-1] if waits else 0.0,
+                run_p50_s=_percentile(runs, 0.5),
+                run_p95_s=_percentile(runs, 0.95),
+            )
+
+    def _run(self, job):
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._wait_samples.append(job.started_at - job.submitted_at)
+        _current.job = job
+        try:
+            result = job.func(*job.args, **job.kwargs)
+        except Exception as e:
+            with self._lock:
+                job.error = e
+                self._finish(job, FAILED)
+            return
+        finally:
+            _current.job = None
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+            else:
+                job.result = result
+                self._finish(job, DONE)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        if job.started_at is not None:
+            self._run_samples.append(job.finished_at - job.started_at)
+        self._counters[{DONE: "completed", FAILED: "failed", CANCELLED: "cancelled"}[status]] += 1
+        job._event.set()
+
+    def _check_capacity(self, user):
+        self._prune()
+        active = [j for j in self._jobs.values() if not j.done]
+        if len(active) >= self.workers + self.max_pending:
+            self._counters["rejected"] += 1
+            raise QueueFull("The enhancement queue is full, please try again shortly")
+        if user is not None and sum(j.user == user for j in active) >= self.per_user_limit:
+            self._counters["rejected"] += 1
+            raise UserLimitReached(
+                f"You already have {self.per_user_limit} enhancements in progress"
+            )
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL_S
+        for job_id in [i for i, j in self._jobs.items() if j.done and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+def cancel_requested():
+    # For job functions: True once the job running on this thread has been
+    # cancelled, so it can skip side effects such as recording history
+    job = getattr(_current, "job", None)
+    return job is not None and job.cancel_requested
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+# PROCESS-WIDE QUEUE
+# Shared by every session; sized from ENHANCER_WORKERS / ENHANCER_MAX_PENDING
+# / ENHANCER_USER_JOBS.
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+def get_queue():
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            max_pending = os.environ.get("ENHANCER_MAX_PENDING")
+            _default_queue = JobQueue(
+                workers=int(os.environ.get("ENHANCER_WORKERS", 0)) or None,
+                max_pending=int(max_pending) if max_pending else None,
+                per_user_limit=int(os.environ.get("ENHANCER_USER_JOBS", 2)),
+            )
+            get_metrics().register_collector(
+                lambda: {f"queue_{k}": v for k, v in _default_queue.metrics().items()}
+            )
+        return _default_queue
@@ -0,0 +1,356 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# INSTRUMENTATION
+# Stages (decode, convert, enhance, compare, encode, store) are timed with
+#
+#     with stage("enhance", technique="Denoise") as span:
+#         result = ...
+#         span.record(result)
+#
+# which feeds a per-stage latency histogram plus byte and pixel counters.
+# record() notes the dimensions and bytes of the array the stage produced.
+# A user action (an upload, a preview, a render, an export) is wrapped in
+# request(); the spans it contains are kept with it, and requests slower than
+# SLOW_REQUEST_S are remembered for the Operations tab. Spans on threads with
+# no open request (e.g. tile workers) still count towards the histograms.
+#
+# render() produces the Prometheus text format; it can be served over HTTP
+# (ENHANCER_METRICS_PORT) or written to a file for node_exporter's textfile
+# collector (ENHANCER_METRICS_FILE).
+
+STAGE_BUCKETS_S = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+SLOW_REQUEST_S = float(os.environ.get("ENHANCER_SLOW_REQUEST_S", 2.0))
+SLOW_REQUEST_ENTRIES = 50
+
+METRICS_FILE_INTERVAL_S = 15.0
+
+PREFIX = "enhancer_"
+
+
+class Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS_S):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Span:
+    def __init__(self, name, labels, path):
+        self.name = name
+        self.labels = labels
+        self.path = path
+        self.attrs = {}
+        self.seconds = None
+
+    def record(self, image=None, **attrs):
+        if image is not None:
+            self.attrs.update(
+                width=image.shape[1], height=image.shape[0],
+                channels=image.shape[2] if image.ndim == 3 else 1,
+                dtype=str(image.dtype), bytes=image.nbytes,
+            )
+        self.attrs.update(attrs)
+        return image
+
+
+class Trace:
+    def __init__(self, kind, user, attrs):
+        self.kind = kind
+        self.user = user
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.spans = []
+        self.seconds = None
+
+    def breakdown(self):
+        totals = {}
+        for span in self.spans:
+            totals[span.path] = totals.get(span.path, 0.0) + span.seconds
+        return totals
+
+    def as_dict(self):
+        return {
+            "time": datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d %H:%M:%S"),
+            "kind": self.kind,
+            "user": self.user,
+            "seconds": self.seconds,
+            "stages": self.breakdown(),
+            "spans": [
+                dict(span.labels, stage=span.path, seconds=span.seconds, **span.attrs)
+                for span in self.spans
+            ],
+            **self.attrs,
+        }
+
+
+class Metrics:
+    def __init__(self, slow_request_s=SLOW_REQUEST_S, slow_entries=SLOW_REQUEST_ENTRIES):
+        self.slow_request_s = slow_request_s
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._slow = deque(maxlen=slow_entries)
+
+    # RECORDING
+
+    @contextmanager
+    def stage(self, name, **labels):
+        stack = self._stack()
+        path = "/".join([s.name for s in stack] + [name])
+        span = Span(name, labels, path)
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            stack.pop()
+            self._record_stage(span)
+            trace = getattr(self._local, "trace", None)
+            if trace is not None:
+                trace.spans.append(span)
+
+    @contextmanager
+    def request(self, kind, user=None, **attrs):
+        # Nested requests fold into the outer one
+        if getattr(self._local, "trace", None) is not None:
+            yield self._local.trace
+            return
+        trace = Trace(kind, user, attrs)
+        self._local.trace = trace
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+            trace.seconds = time.perf_counter() - start
+            self.observe("request_seconds", trace.seconds, kind=kind)
+            if trace.seconds >= self.slow_request_s:
+                with self._lock:
+                    self._slow.append(trace)
+
+    def annotate(self, **attrs):
+        # Attach to the innermost open span, or the request if none is open
+        target = self._current()
+        if target is not None:
+            target.attrs.update(attrs)
+
+    def tally(self, name, amount=1):
+        # Like annotate(), but adds up, e.g. cache hits within one stage
+        target = self._current()
+        if target is not None:
+            target.attrs[name] = target.attrs.get(name, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, collect):
+        # `collect()` returns {metric name: value} gauges, read at render time
+        with self._lock:
+            self._collectors.append(collect)
+
+    def _current(self):
+        stack = self._stack()
+        return stack[-1] if stack else getattr(self._local, "trace", None)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record_stage(self, span):
+        labels = dict(span.labels, stage=span.name)
+        self.observe("stage_seconds", span.seconds, **labels)
+        if "bytes" in span.attrs:
+            self.inc("stage_bytes_total", span.attrs["bytes"], **labels)
+            self.inc("stage_pixels_total", span.attrs["width"] * span.attrs["height"], **labels)
+        for result in ("hit", "miss"):
+            if f"cache_{result}s" in span.attrs:
+                self.inc("stage_cache_total", span.attrs[f"cache_{result}s"], result=result, **labels)
+
+    # READING
+
+    def slow_requests(self):
+        with self._lock:
+            return [trace.as_dict() for trace in reversed(self._slow)]
+
+    def stage_summary(self):
+        with self._lock:
+            rows = []
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name != "stage_seconds":
+                    continue
+                rows.append(dict(
+                    labels,
+                    count=histogram.count,
+                    mean_s=histogram.sum / histogram.count,
+                    p50_s=histogram.quantile(0.5),
+                    p95_s=histogram.quantile(0.95),
+                ))
+            return rows
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            collectors = list(self._collectors)
+
+        _render_family(lines, histograms, "histogram", _render_histogram)
+        _render_family(lines, counters, "counter", _render_sample)
+        for collect in collectors:
+            for name, value in sorted(collect().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {PREFIX}{name} gauge")
+                    lines.append(f"{PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _render_family(lines, items, kind, render_one):
+    current = None
+    for (name, labels), value in items:
+        if name != current:
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            current = name
+        render_one(lines, PREFIX + name, labels, value)
+
+def _render_histogram(lines, name, labels, histogram):
+    for bound, total in histogram.cumulative():
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f"{name}_bucket{_labels(labels, [('le', le)])} {total}")
+    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+def _render_sample(lines, name, labels, value):
+    lines.append(f"{name}{_labels(labels)} {value}")
+
+
+# PROCESS-WIDE METRICS
+
+_default_metrics = Metrics()
+
+def get_metrics():
+    return _default_metrics
+
+def stage(name, **labels):
+    return _default_metrics.stage(name, **labels)
+
+def request(kind, user=None, **attrs):
+    return _default_metrics.request(kind, user, **attrs)
+
+def annotate(**attrs):
+    _default_metrics.annotate(**attrs)
+
+def tally(name, amount=1):
+    _default_metrics.tally(name, amount)
+
+
+# EXPORTERS
+
+def write_metrics(path, metrics=None):
+    # Atomic, so a scraper never reads half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write((metrics or _default_metrics).render())
+    os.replace(tmp_path, path)
+
+def start_metrics_file(path, interval_s=METRICS_FILE_INTERVAL_S, metrics=None):
+    def loop():
+        while True:
+            try:
+                write_metrics(path, metrics)
+            except OSError:
+                pass
+            time.sleep(interval_s)
+
+    thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+def start_metrics_server(port, host="0.0.0.0", metrics=None):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = (metrics or _default_metrics).render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def start_exporters_from_env():
+    # ENHANCER_METRICS_PORT serves /metrics; ENHANCER_METRICS_FILE is
+    # rewritten every METRICS_FILE_INTERVAL_S seconds
+    started = {}
+    port = os.environ.get("ENHANCER_METRICS_PORT")
+    if port:
+        started["server"] = start_metrics_server(int(port))
+    path = os.environ.get("ENHANCER_METRICS_FILE")
+    if path:
+        started["file"] = start_metrics_file(path)
+    return started
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+# SALT & PEPPER NOISE
+# Works on the image's own dtype and layout: a color pixel hit by salt turns
+# white in every channel rather than the image being reduced to gray first.
+# One float32 uniform draw per pixel decides it: below amount * salt_vs_pepper
+# is salt, below amount is pepper. The same per-pixel probabilities as
+# skimage's random_noise(mode="s&p"), without its float64 copy of the image.
+#
+# A generator keeps its random and mask buffers between calls, so noising
+# many same-sized images or frames allocates nothing after the first. With a
+# seed, the same image shape always gets the same noise.
+
+DEFAULT_AMOUNT = 0.05
+DEFAULT_SALT_VS_PEPPER = 0.5
+
+
+class SaltPepperNoise:
+    def __init__(self, amount=DEFAULT_AMOUNT, salt_vs_pepper=DEFAULT_SALT_VS_PEPPER, seed=None):
+        if not 0.0 <= amount <= 1.0:
+            raise ValueError(f"amount must be between 0 and 1, got {amount}")
+        if not 0.0 <= salt_vs_pepper <= 1.0:
+            raise ValueError(f"salt_vs_pepper must be between 0 and 1, got {salt_vs_pepper}")
+        self.amount = amount
+        self.salt_vs_pepper = salt_vs_pepper
+        self.rng = np.random.default_rng(seed)
+        self._uniform = None
+        self._mask = None
+
+    def _buffers(self, shape):
+        if self._uniform is None or self._uniform.shape != shape:
+            self._uniform = np.empty(shape, dtype=np.float32)
+            self._mask = np.empty(shape, dtype=bool)
+        return self._uniform, self._mask
+
+    def apply(self, image, out=None):
+        # `out` may be `image` itself to noise in place
+        if out is None:
+            out = np.empty_like(image)
+        if out is not image:
+            np.copyto(out, image)
+        if image.dtype.kind in "ui":
+            info = np.iinfo(image.dtype)
+            low, high = max(info.min, 0), info.max
+        else:
+            low, high = 0.0, 1.0
+
+        uniform, mask = self._buffers(image.shape[:2])
+        self.rng.random(dtype=np.float32, out=uniform)
+        where = mask if image.ndim == 2 else mask[:, :, None]
+        # Pepper everything under `amount`, then salt the lower part of it
+        np.less(uniform, self.amount, out=mask)
+        np.copyto(out, low, where=where)
+        np.less(uniform, self.amount * self.salt_vs_pepper, out=mask)
+        np.copyto(out, high, where=where)
+        return out
+
+    def apply_many(self, images, out=None):
+        # Lazily noises a sequence of images or frames; with `out` every result
+        # is written into the same array, so consume each before the next
+        for image in images:
+            yield self.apply(image, out)
+
+
+def salt_and_pepper(image, out=None, amount=DEFAULT_AMOUNT, salt_vs_pepper=DEFAULT_SALT_VS_PEPPER, seed=None):
+    return SaltPepperNoise(amount, salt_vs_pepper, seed).apply(image, out)
@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+from enhancer.metrics import stage
+from enhancer.noise import salt_and_pepper
+
+
+# COLOR HELPERS
+# Images are either single-channel gray or 3-channel BGR, uint8 or uint16
+# (16-bit scans keep their depth). Operations whose result is gray by nature
+# return one channel, every operation returns its input's dtype, and callers
+# expand or reduce only when they must (display, or an 8-bit-only format).
+
+def to_gray(image, out=None):
+    if image.ndim == 2:
+        return image
+    with stage("convert", to="gray") as span:
+        return span.record(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=out))
+
+def to_bgr(image, out=None):
+    if image.ndim == 3:
+        return image
+    with stage("convert", to="bgr") as span:
+        return span.record(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR, dst=out))
+
+def to_uint8(image):
+    if image.dtype == np.uint8:
+        return image
+    return cv2.convertScaleAbs(image, alpha=255 / np.iinfo(image.dtype).max)
+
+def histogram(channel):
+    # 256 bins for uint8, 65536 for uint16
+    return np.bincount(channel.ravel(), minlength=np.iinfo(channel.dtype).max + 1)
+
+def apply_lut(channel, lut, out=None):
+    if channel.dtype == np.uint8 and lut.dtype == np.uint8:
+        return cv2.LUT(channel, lut, dst=out)
+    # cv2.LUT only takes 8-bit input
+    return np.take(lut, channel, out=out)
+
+def equalization_lut(hist):
+    # Same curve cv2.equalizeHist builds, including its float32 rounding, so a
+    # histogram gathered elsewhere (e.g. across tiles) gives identical output.
+    # A 65536-bin histogram gives the 16-bit table; float32 can't count that
+    # many pixels exactly, so it is built in float64.
+    hist = np.asarray(hist, dtype=np.int64).ravel()
+    levels = len(hist)
+    ftype = np.float32 if levels <= 256 else np.float64
+    lut = np.zeros(levels, dtype=np.uint8 if levels <= 256 else np.uint16)
+    nonzero = np.flatnonzero(hist)
+    if len(nonzero) == 0:
+        return lut
+    first = nonzero[0]
+    total = int(hist.sum())
+    if hist[first] == total:
+        lut[:] = first
+        return lut
+    scale = ftype(levels - 1) / ftype(total - hist[first])
+    cumulative = np.cumsum(hist[first + 1:]).astype(ftype)
+    lut[first + 1:] = np.clip(np.rint(cumulative * scale), 0, levels - 1)
+    return lut
+
+def complement_lut(hist=None):
+    return np.arange(255, -1, -1, dtype=np.uint8)
+
+
+# NATIVE KERNELS
+# Work on gray or BGR input without forcing a colorspace, and write into `out`
+# when the caller has a buffer to reuse. `out` must not alias the input.
+
+SHARPEN_KERNEL = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+
+# The sigma OpenCV derives for a 5x5 kernel with sigma=0
+GAUSSIAN_SIGMA = 0.3 * ((5 - 1) * 0.5 - 1) + 0.8
+
+def equalize_channel(channel, out=None):
+    if channel.dtype == np.uint8:
+        return cv2.equalizeHist(channel, dst=out)
+    return apply_lut(channel, equalization_lut(histogram(channel)), out=out)
+
+def equalize(image, out=None):
+    if image.ndim == 2:
+        return equalize_channel(image, out)
+    img_yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
+    img_yuv[:,:,0] = equalize_channel(img_yuv[:,:,0])
+    return cv2.cvtColor(img_yuv, cv2.COLOR_YUV2BGR, dst=out)
+
+def gaussian_blur(image, out=None, scale=1.0):
+    if scale == 1.0:
+        return cv2.GaussianBlur(image, (5, 5), 0, dst=out)
+    # Downscaled preview: same blur measured in full-resolution pixels
+    return cv2.GaussianBlur(image, (0, 0), GAUSSIAN_SIGMA * scale, dst=out)
+
+def sharpen(image, out=None):
+    return cv2.filter2D(image, -1, SHARPEN_KERNEL, dst=out)
+
+def detect_edges(image, out=None):
+    if image.dtype == np.uint8:
+        return cv2.Canny(image, 100, 200, edges=out)
+    # Canny is 8-bit only, and its thresholds are in 8-bit units anyway
+    edges = cv2.Canny(to_uint8(image), 100, 200)
+    return np.multiply(edges, np.iinfo(image.dtype).max // 255, out=out, dtype=image.dtype)
+
+def complement(image, out=None):
+    return cv2.bitwise_not(to_gray(image), dst=out)
+
+
+# IMAGE PROCESSING FUNCTIONS
+# Whole-image entry points used by the app and batch CLI: BGR or gray in, the
+# kernel's native layout and the input's dtype out. Nothing is expanded to
+# three channels here; see enhancer.codec.to_display.
+
+def apply_histogram_equalization(image):
+    return equalize(image)
+
+def apply_gaussian_blur(image, scale=1.0):
+    return gaussian_blur(image, scale=scale)
+
+def apply_sharpening(image):
+    return sharpen(image)
+
+def apply_edge_detection(image):
+    return detect_edges(image)
+
+def apply_complement(image):
+    return complement(image)
+
+def apply_salt_and_pepper(image, amount=0.05, salt_vs_pepper=0.5, seed=None):
+    return salt_and_pepper(image, amount=amount, salt_vs_pepper=salt_vs_pepper, seed=seed)
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+from enhancer.cache import get_cache, image_key, result_key
+from enhancer.metrics import stage
+from enhancer.operations import to_bgr, to_gray
+from enhancer.registry import Operation, get_operation, is_cacheable
+
+
+# PIPELINES
+# Chain techniques, e.g. run_pipeline(image, ["Denoise", "Histogram",
+# "Sharpening"]). Steps run on their native kernels, so a gray intermediate
+# stays one channel and colorspaces are converted only when a step needs it.
+# Runs of per-pixel steps (Complement, Histogram on gray) are collapsed into a
+# single 256-entry LUT: data-dependent tables are built from the histogram
+# pushed through the earlier tables, so the image is read once for the
+# histogram and once for the LUT (8-bit only; 16-bit steps run one by one).
+# Intermediates ping-pong between two reused buffers per shape instead of
+# allocating per step. The result keeps its native layout and dtype; pass
+# expand=True for 3-channel BGR.
+
+def normalize_steps(steps):
+    normalized = []
+    for step in steps:
+        name, params = (step, {}) if isinstance(step, (str, Operation)) else step
+        operation = name if isinstance(name, Operation) else get_operation(name)
+        normalized.append((operation, dict(params)))
+    return normalized
+
+
+class _Buffers:
+    def __init__(self):
+        self._buffers = []
+
+    def take(self, shape, dtype, avoid=None):
+        for buf in self._buffers:
+            if buf.shape == shape and buf.dtype == dtype and buf is not avoid:
+                return buf
+        buf = np.empty(shape, dtype=dtype)
+        self._buffers.append(buf)
+        return buf
+
+
+def _output_shape(operation, image):
+    if operation.channels == 1:
+        return image.shape[:2]
+    if operation.channels == 3:
+        return image.shape[:2] + (3,)
+    return image.shape
+
+def _fusable(operation, params, image):
+    return (
+        operation.point_lut is not None
+        and not params
+        and image.dtype == np.uint8
+        and (image.ndim == 2 or operation.channels == 1)
+    )
+
+def _apply_point_run(image, luts, buffers, owned):
+    if image.ndim == 3:
+        gray = to_gray(image, out=buffers.take(image.shape[:2], image.dtype, avoid=image))
+        owned = True
+    else:
+        gray = image
+
+    composed = np.arange(256, dtype=np.uint8)
+    hist = None
+    if any(callable(lut) for lut in luts):
+        hist = np.bincount(gray.ravel(), minlength=256)
+    for lut in luts:
+        if callable(lut):
+            lut = lut(hist)
+        composed = lut[composed]
+        if hist is not None:
+            hist = np.bincount(lut, weights=hist, minlength=256)
+
+    # A LUT is per-pixel, so it can safely run in place on our own buffer
+    dst = gray if owned else buffers.take(gray.shape, gray.dtype, avoid=gray)
+    return cv2.LUT(gray, composed, dst=dst)
+
+def run_pipeline(image, steps, expand=False):
+    steps = normalize_steps(steps)
+    buffers = _Buffers()
+    current = image
+    i = 0
+    while i < len(steps):
+        operation, params = steps[i]
+        if _fusable(operation, params, current):
+            start = i
+            luts = [operation.point_lut]
+            i += 1
+            # After the first step the run is on a gray image
+            while i < len(steps) and steps[i][0].point_lut is not None and not steps[i][1]:
+                luts.append(steps[i][0].point_lut)
+                i += 1
+            with stage("enhance", technique="+".join(s[0].name for s in steps[start:i])) as span:
+                current = span.record(_apply_point_run(current, luts, buffers, owned=current is not image))
+            continue
+
+        out = buffers.take(_output_shape(operation, current), current.dtype, avoid=current)
+        with stage("enhance", technique=operation.name) as span:
+            current = span.record(operation.kernel(current, out=out, **params))
+        i += 1
+
+    if current is image:
+        current = current.copy()
+    return to_bgr(current) if expand else current
+
+def cached_run_pipeline(image, steps, source_key=None, cache=None, expand=False):
+    steps = normalize_steps(steps)
+    if not all(is_cacheable(operation, params) for operation, params in steps):
+        return run_pipeline(image, steps, expand=expand)
+    cache = cache or get_cache()
+    spec = {"steps": [[operation.name, params] for operation, params in steps], "expand": expand}
+    key = result_key(source_key or image_key(image), "pipeline", spec)
+    return cache.get_or_compute(key, lambda: run_pipeline(image, steps, expand=expand))
@@ -0,0 +1,46 @@
+import cv2
+
+from enhancer.cache import get_cache, image_key, result_key
+from enhancer.pipeline import cached_run_pipeline, normalize_steps
+
+
+# PREVIEW
+# Runs a recipe on a downscaled proxy sized for the comparison viewer so the
+# UI can show the effect almost instantly; the full-resolution render only
+# happens when the user confirms. Operations marked `scale_aware` receive
+# `scale=` and shrink their kernels to match, so a blur or denoise looks on the
+# proxy the way it will on the final image. Sharpening's 3x3 kernel is already
+# the smallest possible and is applied unchanged.
+
+PREVIEW_MAX_SIDE = 700
+
+def make_proxy(image, max_side=PREVIEW_MAX_SIDE):
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale == 1.0:
+        return image, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+def scale_steps(steps, scale):
+    scaled = []
+    for operation, params in normalize_steps(steps):
+        if operation.scale_aware and scale != 1.0:
+            params = dict(params, scale=scale)
+        scaled.append((operation, params))
+    return scaled
+
+def preview_pipeline(image, steps, source_key=None, max_side=PREVIEW_MAX_SIDE, cache=None):
+    # Returns (proxy, enhanced proxy)
+    cache = cache or get_cache()
+    source_key = source_key or image_key(image)
+    proxy_key = result_key(source_key, "proxy", {"max_side": max_side})
+
+    height, width = image.shape[:2]
+    if max(height, width) <= max_side:
+        proxy, scale = image, 1.0
+    else:
+        proxy = cache.get_or_compute(proxy_key, lambda: make_proxy(image, max_side)[0])
+        scale = proxy.shape[1] / width
+    result = cached_run_pipeline(proxy, scale_steps(steps, scale), source_key=proxy_key, cache=cache)
+    return proxy, result
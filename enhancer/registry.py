@@ -0,0 +1,130 @@
+from dataclasses import dataclass
+
+from enhancer.denoise import DENOISE_HALO, apply_denoise, denoise
+from enhancer.metrics import stage
+from enhancer.operations import (
+    apply_complement,
+    apply_edge_detection,
+    apply_gaussian_blur,
+    apply_histogram_equalization,
+    apply_salt_and_pepper,
+    apply_sharpening,
+    complement,
+    complement_lut,
+    detect_edges,
+    equalization_lut,
+    equalize,
+    gaussian_blur,
+    salt_and_pepper,
+    sharpen,
+)
+from enhancer.tiling import DEFAULT_TILE_SIZE, equalize_histogram_tiled, run_tiled, salt_and_pepper_tiled
+
+
+# OPERATION REGISTRY
+# Techniques are keyed by the short name stored in a user's
+# enhancement_history ("Histogram", "Denoise", ...); the label is what the UI
+# shows in its selectbox.
+#
+# `halo` is how many pixels of context around a tile the operation reads (its
+# kernel radius) and is what makes tiled execution exact. Operations that need
+# the whole image at once provide their own `tiled` implementation instead.
+# Results of non-deterministic operations are never cached; `cacheable` can
+# also be a function of the call's params (Salt is cacheable once seeded).
+#
+# `kernel` is the native version used by pipelines: it keeps gray images gray
+# and can write into a reused buffer. `channels` is what it returns (None for
+# the same layout as its input, 1 for gray, 3 for BGR). Per-pixel operations
+# also give a `point_lut`, either a fixed 256-entry table or a function of the
+# gray histogram, so consecutive ones can be fused into a single LUT pass.
+# `scale_aware` operations take `scale=` and resize their kernels for
+# downscaled previews.
+
+@dataclass(frozen=True)
+class Operation:
+    name: str
+    label: str
+    func: object
+    halo: int = 0
+    tiled: object = None
+    cacheable: object = True
+    kernel: object = None
+    channels: int = None
+    point_lut: object = None
+    scale_aware: bool = False
+
+
+OPERATIONS = {}
+
+def register(operation):
+    OPERATIONS[operation.name] = operation
+    return operation
+
+def get_operation(name):
+    # Accept the key, the UI label, or a lower-case CLI spelling
+    key = name.split(" ")[0].lower()
+    for op_name, operation in OPERATIONS.items():
+        if op_name.lower() == key:
+            return operation
+    raise KeyError(f"Unknown enhancement technique: {name}")
+
+def is_cacheable(operation, params):
+    if callable(operation.cacheable):
+        return operation.cacheable(params)
+    return operation.cacheable
+
+def technique_labels():
+    return [op.label for op in OPERATIONS.values()]
+
+def apply_technique(name, image, **params):
+    operation = get_operation(name)
+    with stage("enhance", technique=operation.name) as span:
+        return span.record(operation.func(image, **params))
+
+def apply_tiled(name, image, tile_size=DEFAULT_TILE_SIZE, out=None, out_path=None, **params):
+    operation = get_operation(name)
+    if operation.tiled is not None:
+        return operation.tiled(image, tile_size=tile_size, out=out, out_path=out_path, **params)
+    return run_tiled(
+        operation.func, image, halo=operation.halo, tile_size=tile_size,
+        out=out, out_path=out_path, **params
+    )
+
+
+register(Operation(
+    "Histogram", "Histogram Equalization (Contrast)", apply_histogram_equalization,
+    tiled=equalize_histogram_tiled, kernel=equalize, point_lut=equalization_lut
+))
+# 5x5 kernel
+register(Operation(
+    "Gaussian", "Gaussian Blur (Smoothing)", apply_gaussian_blur,
+    halo=2, kernel=gaussian_blur, scale_aware=True
+))
+# 3x3 kernel
+register(Operation(
+    "Sharpening", "Sharpening (Detail Enhancement)", apply_sharpening,
+    halo=1, kernel=sharpen
+))
+# Sobel + non-maximum suppression need 2px; hysteresis can follow an edge
+# further than any halo, so very long weak edges may differ at tile seams
+register(Operation(
+    "Edge", "Edge Detection (Feature Extraction)", apply_edge_detection,
+    halo=16, kernel=detect_edges, channels=1
+))
+register(Operation(
+    "Complement", "Complement (Invert Colors)", apply_complement,
+    kernel=complement, channels=1, point_lut=complement_lut()
+))
+# Takes amount=, salt_vs_pepper= and seed=, see enhancer/noise.py; only
+# seeded noise is reproducible, so only that is cached
+register(Operation(
+    "Salt", "Salt & Pepper Noise (Film Grain)", apply_salt_and_pepper,
+    tiled=salt_and_pepper_tiled, cacheable=lambda params: params.get("seed") is not None,
+    kernel=salt_and_pepper
+))
+# Takes tier= ("fast", "balanced", "quality", "parallel" or "auto"), see
+# enhancer/denoise.py
+register(Operation(
+    "Denoise", "Denoise (Noise Reduction)", apply_denoise,
+    halo=DENOISE_HALO, kernel=denoise, scale_aware=True
+))
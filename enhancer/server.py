@@ -0,0 +1,392 @@
+# HTTP enhancement API.
+#
+#   python -m enhancer.server --port 8502 [--users-db users.db]
+#
+# or alongside the app by setting ENHANCER_API_PORT. Requests authenticate with
+# HTTP Basic (an app account's email and password) and every enhancement is
+# recorded in that user's history, just like the UI does.
+#
+#   GET  /health                       queue and cache status (no auth)
+#   GET  /techniques                   technique names and labels
+#   POST /enhance?steps=Histogram,Sharpening&format=png
+#        body: the image bytes; response: the enhanced image bytes
+#   POST /batch?steps=Denoise&format=jpeg
+#        body: multipart/form-data with one or more files; response:
+#        multipart/mixed with one enhanced image per input, in order
+#
+# Step parameters go in the query as <Step>.<param>, e.g. Denoise.tier=fast or
+# Salt.seed=7; codec settings as plain parameters (quality=90,
+# compress_level=3). Images travel as raw bytes, never base64.
+#
+# The connection is HTTP/1.1 keep-alive. Work runs on the shared JobQueue, so
+# the API and the app draw from one bounded pool. When it is saturated, or the
+# user already has their limit of jobs in flight, the answer is 429 with
+# Retry-After rather than an ever-growing backlog.
+#
+# Authentication and admission are decided from the headers alone, so an
+# upload that is turned away is never read: at most ENHANCER_API_MAX_IN_FLIGHT
+# request bodies are held at once, and at most ENHANCER_API_MAX_CONNECTIONS
+# connections get a thread.
+
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import uuid
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from enhancer.cache import bytes_key, cached_decode, get_cache
+from enhancer.export import FORMATS, encode_image, normalize_format
+from enhancer.jobs import CANCELLED, QueueFull, UserLimitReached, get_queue
+from enhancer.metrics import request
+from enhancer.pipeline import cached_run_pipeline
+from enhancer.registry import OPERATIONS, get_operation
+
+DEFAULT_PORT = 8502
+MAX_BODY_BYTES = int(float(os.environ.get("ENHANCER_API_MAX_MB", 200)) * 2**20)
+MAX_IN_FLIGHT = int(os.environ.get("ENHANCER_API_MAX_IN_FLIGHT", 8))
+MAX_CONNECTIONS = int(os.environ.get("ENHANCER_API_MAX_CONNECTIONS", 64))
+RETRY_AFTER_S = 2
+# Idle keep-alive connections are closed after this long
+KEEP_ALIVE_TIMEOUT_S = 30
+
+CODEC_PARAMS = ("quality", "compress_level", "method", "lossless", "optimize", "progressive")
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# REQUEST PARSING
+
+def _coerce(value):
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+def parse_recipe(query):
+    # -> (steps, format, codec settings) from the query string
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    names = [s for s in params.pop("steps", "").split(",") if s]
+    if not names:
+        raise ApiError(400, "steps is required, e.g. ?steps=Histogram,Sharpening")
+    settings = {k: _coerce(params.pop(k)) for k in CODEC_PARAMS if k in params}
+    step_params = {}
+    try:
+        operations = [get_operation(name) for name in names]
+        fmt = normalize_format(params.pop("format", "png"))
+        for key, value in params.items():
+            step, _, name = key.partition(".")
+            if name:
+                step_params.setdefault(get_operation(step).name, {})[name] = _coerce(value)
+    except (KeyError, ValueError) as e:
+        raise ApiError(400, str(e).strip("'\""))
+    steps = [(op.name, step_params.get(op.name, {})) for op in operations]
+    return steps, fmt, settings
+
+def parse_multipart(content_type, body):
+    # -> [(filename, bytes)] for every file part
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    if not message.is_multipart():
+        raise ApiError(400, "Expected a multipart/form-data body")
+    files = []
+    for part in message.iter_parts():
+        filename = part.get_filename()
+        if filename is None:
+            continue
+        files.append((filename, part.get_payload(decode=True) or b""))
+    if not files:
+        raise ApiError(400, "No files in the multipart body")
+    return files
+
+
+# PROCESSING
+# Runs on a JobQueue worker.
+
+def enhance_bytes(data, steps, fmt, settings):
+    # -> an Export; large ones are spooled to disk, and the handler streams
+    # and then discards them
+    source_key = bytes_key(data)
+    image = cached_decode(data)
+    result = cached_run_pipeline(image, steps, source_key=source_key)
+    return encode_image(result, fmt, **settings)
+
+def enhance_files(store, email, files, steps, fmt, settings):
+    # -> [(filename, Export or None, error or None)], recording each success
+    results = []
+    with request("api", user=email, files=len(files)):
+        for filename, data in files:
+            try:
+                encoded = enhance_bytes(data, steps, fmt, settings)
+            except Exception as e:
+                results.append((filename, None, f"{type(e).__name__}: {e}"))
+                continue
+            for step, _ in steps:
+                store.record_enhancement(email, step, filename)
+            results.append((filename, encoded, None))
+    return results
+
+
+# HANDLER
+
+def output_name(filename, fmt):
+    stem = os.path.splitext(os.path.basename(filename or "image"))[0]
+    return f"{stem}_enhanced.{FORMATS[fmt]['extension']}"
+
+
+class EnhanceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT_S
+    server_version = "enhancer"
+
+    # Set by make_server()
+    store = None
+    queue = None
+    in_flight = None
+
+    # True while the current request's body is still unread
+    _body_pending = False
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "queue": self.queue.metrics(), "cache": get_cache().stats()})
+        elif path == "/techniques":
+            if self._authenticate():
+                self._send_json(200, [{"name": op.name, "label": op.label} for op in OPERATIONS.values()])
+        else:
+            self._send_json(404, {"error": f"No such endpoint: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        self._body_pending = True
+        try:
+            email = self._authenticate()
+            if not email:
+                return
+            if url.path == "/enhance":
+                handler = self._enhance
+            elif url.path == "/batch":
+                handler = self._batch
+            else:
+                raise ApiError(404, f"No such endpoint: {url.path}")
+            self._admit(email)
+            try:
+                handler(email, url.query, self._read_body())
+            finally:
+                self.in_flight.release()
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+
+    def _enhance(self, email, query, body):
+        steps, fmt, settings = parse_recipe(query)
+        if not body:
+            raise ApiError(400, "Send the image bytes as the request body")
+        filename = self.headers.get("X-Filename") or "api"
+        [(_, export, error)] = self._run(email, [(filename, body)], steps, fmt, settings)
+        if error:
+            raise ApiError(422, error)
+        try:
+            self._stream(200, export.chunks(), export.size, FORMATS[fmt]["mime"], {
+                "Content-Disposition": f'inline; filename="{output_name(filename, fmt)}"',
+            })
+        finally:
+            export.discard()
+
+    def _batch(self, email, query, body):
+        steps, fmt, settings = parse_recipe(query)
+        content_type = self.headers.get("Content-Type", "")
+        if not content_type.startswith("multipart/form-data"):
+            raise ApiError(415, "POST /batch takes multipart/form-data")
+        results = self._run(email, parse_multipart(content_type, body), steps, fmt, settings)
+
+        # Part headers are built up front so Content-Length is known; the
+        # encoded images are streamed from their exports
+        boundary = uuid.uuid4().hex
+        parts = []
+        for filename, export, error in results:
+            if error:
+                headers = "Content-Type: application/json\r\nX-Error: true\r\n"
+                payload = [json.dumps({"filename": filename, "error": error}).encode()]
+                size = len(payload[0])
+            else:
+                headers = (
+                    f"Content-Type: {FORMATS[fmt]['mime']}\r\n"
+                    f'Content-Disposition: attachment; filename="{output_name(filename, fmt)}"\r\n'
+                )
+                payload, size = export.chunks(), export.size
+            parts.append((f"--{boundary}\r\n{headers}Content-Length: {size}\r\n\r\n".encode(), payload, size))
+        closing = f"--{boundary}--\r\n".encode()
+
+        def body_chunks():
+            for head, payload, _ in parts:
+                yield head
+                yield from payload
+                yield b"\r\n"
+            yield closing
+
+        length = sum(len(head) + size + 2 for head, _, size in parts) + len(closing)
+        try:
+            self._stream(200, body_chunks(), length, f"multipart/mixed; boundary={boundary}")
+        finally:
+            for _, export, _ in results:
+                if export is not None:
+                    export.discard()
+
+    def _run(self, email, files, steps, fmt, settings):
+        try:
+            job = self.queue.submit(email, enhance_files, self.store, email, files, steps, fmt, settings)
+        except (QueueFull, UserLimitReached) as e:
+            raise ApiError(429, str(e))
+        job.wait()
+        if job.error is not None:
+            raise ApiError(500, f"{type(job.error).__name__}: {job.error}")
+        if job.status == CANCELLED or job.result is None:
+            raise ApiError(503, "The enhancement was cancelled, please try again")
+        return job.result
+
+    def _admit(self, email):
+        # Takes an in-flight slot, which the caller releases, or answers 429
+        # while the body is still unread
+        try:
+            self.queue.check_capacity(email)
+        except (QueueFull, UserLimitReached) as e:
+            raise ApiError(429, str(e))
+        if not self.in_flight.acquire(blocking=False):
+            raise ApiError(429, "Too many uploads in progress, please try again shortly")
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ApiError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, f"Request body over {MAX_BODY_BYTES // 2**20} MB")
+        body = self.rfile.read(length) if length else b""
+        self._body_pending = False
+        return body
+
+    def _authenticate(self):
+        header = self.headers.get("Authorization", "")
+        if header.startswith("Basic "):
+            try:
+                email, _, password = base64.b64decode(header[6:]).decode().partition(":")
+            except (ValueError, UnicodeDecodeError):
+                email = password = None
+            if email and self.store.authenticate(email, password):
+                return email
+        self._send_json(401, {"error": "Authentication required"},
+                        {"WWW-Authenticate": 'Basic realm="enhancer"'})
+        return None
+
+    def _send_json(self, status, payload, headers=None):
+        if status == 429:
+            headers = dict(headers or {}, **{"Retry-After": str(RETRY_AFTER_S)})
+        self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self._stream(status, [body], len(body), content_type, headers)
+
+    def _stream(self, status, chunks, length, content_type, headers=None):
+        if self._body_pending:
+            # The body was left unread, so this connection can't be reused
+            self.close_connection = True
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# SERVER
+
+class BoundedHTTPServer(ThreadingHTTPServer):
+    # A thread per connection, but no more than `max_connections` of them;
+    # connections past that are closed straight away
+    def __init__(self, address, handler, max_connections=MAX_CONNECTIONS):
+        super().__init__(address, handler)
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def make_server(store, host="127.0.0.1", port=DEFAULT_PORT, queue=None,
+                max_in_flight=MAX_IN_FLIGHT, max_connections=MAX_CONNECTIONS):
+    handler = type("Handler", (EnhanceHandler,), {
+        "store": store,
+        "queue": queue or get_queue(),
+        "in_flight": threading.BoundedSemaphore(max_in_flight),
+    })
+    return BoundedHTTPServer((host, port), handler, max_connections)
+
+def start_server(store, host="127.0.0.1", port=DEFAULT_PORT, queue=None):
+    # Serves on a daemon thread, e.g. next to the Streamlit app
+    server = make_server(store, host, port, queue)
+    threading.Thread(target=server.serve_forever, name="enhancer-api", daemon=True).start()
+    return server
+
+def start_server_from_env(store):
+    # ENHANCER_API_PORT (and optionally ENHANCER_API_HOST) serve the API
+    port = os.environ.get("ENHANCER_API_PORT")
+    if not port:
+        return None
+    return start_server(store, os.environ.get("ENHANCER_API_HOST", "127.0.0.1"), int(port))
+
+
+def main(argv=None):
+    from enhancer.store import UserStore
+
+    parser = argparse.ArgumentParser(description="Serve the enhancement techniques over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--users-db", default=os.environ.get("ENHANCER_USERS_DB", "users.db"))
+    args = parser.parse_args(argv)
+
+    server = make_server(UserStore(args.users_db), args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from enhancer.metrics import stage
+
+
+# USER STORE
+# SQLite in WAL mode: readers never block the writer, each enhancement is a
+# single small transaction (counter bump + one history row) instead of a
+# rewrite of every user's history, and concurrent sessions can't lose each
+# other's updates. Users are looked up by primary key and history by an
+# (email, id) index. An existing users.json is imported on first open.
+#
+# Analytics never scan history: each write also bumps a per-user technique
+# counter, an hourly activity bucket and an hourly per-technique bucket, and
+# charts read those aggregates.
+
+HISTORY_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+BUCKET_DATE_FORMAT = "%Y-%m-%d %H"
+
+# PRAGMA user_version: 1 = users.json imported, 2 = aggregates built,
+# 3 = per-technique hourly buckets built
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    dob TEXT NOT NULL,
+    password TEXT NOT NULL,
+    enhancement_count INTEGER NOT NULL DEFAULT 0,
+    join_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS enhancement_types (
+    email TEXT NOT NULL,
+    technique TEXT NOT NULL,
+    PRIMARY KEY (email, technique)
+);
+CREATE TABLE IF NOT EXISTS enhancement_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    technique TEXT NOT NULL,
+    date TEXT NOT NULL,
+    filename TEXT
+);
+CREATE INDEX IF NOT EXISTS enhancement_history_email ON enhancement_history (email, id);
+CREATE TABLE IF NOT EXISTS technique_counts (
+    email TEXT NOT NULL,
+    technique TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (email, technique)
+);
+CREATE TABLE IF NOT EXISTS activity_hourly (
+    email TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (email, bucket)
+);
+CREATE TABLE IF NOT EXISTS technique_hourly (
+    email TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    technique TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (email, bucket, technique)
+);
+"""
+
+
+class UserStore:
+    def __init__(self, path="users.db", legacy_json=None):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+        # Both checks are repeated under the write lock: several processes
+        # may open a fresh database at once, and only the first may migrate
+        if legacy_json and os.path.exists(legacy_json) and self._user_version() == 0:
+            self.migrate_from_json(legacy_json, only_once=True)
+        if self._user_version() < SCHEMA_VERSION:
+            with self._transaction() as db:
+                if self._user_version() < SCHEMA_VERSION:
+                    self._rebuild_aggregates(db)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _user_version(self):
+        return self._connection().execute("PRAGMA user_version").fetchone()[0]
+
+    # MIGRATION
+
+    def migrate_from_json(self, json_path, only_once=False):
+        # Returns how many users were imported. With only_once nothing is
+        # imported into a database that has already been migrated.
+        with open(json_path, "r") as f:
+            users = json.load(f)
+        with self._transaction() as db:
+            if only_once and self._user_version() != 0:
+                return 0
+            for email, data in users.items():
+                self._insert_user(db, email, data, data.get("enhancement_count", 0))
+                db.executemany(
+                    "INSERT OR IGNORE INTO enhancement_types (email, technique) VALUES (?, ?)",
+                    [(email, t) for t in data.get("enhancement_types", [])]
+                )
+                db.executemany(
+                    "INSERT INTO enhancement_history (email, technique, date, filename) VALUES (?, ?, ?, ?)",
+                    [
+                        (email, _legacy_technique(h), h["date"], h.get("filename"))
+                        for h in data.get("enhancement_history", [])
+                    ]
+                )
+            self._rebuild_aggregates(db)
+        return len(users)
+
+    def _rebuild_aggregates(self, db):
+        db.execute("DELETE FROM technique_counts")
+        db.execute("DELETE FROM activity_hourly")
+        db.execute("DELETE FROM technique_hourly")
+        db.execute(
+            "INSERT INTO technique_counts (email, technique, count) "
+            "SELECT email, technique, COUNT(*) FROM enhancement_history "
+            "GROUP BY email, technique ORDER BY MIN(id)"
+        )
+        db.execute(
+            "INSERT INTO activity_hourly (email, bucket, count) "
+            "SELECT email, substr(date, 1, 13), COUNT(*) FROM enhancement_history "
+            "GROUP BY email, substr(date, 1, 13)"
+        )
+        db.execute(
+            "INSERT INTO technique_hourly (email, bucket, technique, count) "
+            "SELECT email, substr(date, 1, 13), technique, COUNT(*) FROM enhancement_history "
+            "GROUP BY email, substr(date, 1, 13), technique ORDER BY MIN(id)"
+        )
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # READS
+
+    def exists(self, email):
+        row = self._connection().execute(
+            "SELECT 1 FROM users WHERE email = ?", (email,)
+        ).fetchone()
+        return row is not None
+
+    def authenticate(self, email, password):
+        row = self._connection().execute(
+            "SELECT password FROM users WHERE email = ?", (email,)
+        ).fetchone()
+        return row is not None and row["password"] == password
+
+    def get_user(self, email, history_limit=None):
+        db = self._connection()
+        row = db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return None
+        user = {k: row[k] for k in row.keys() if k != "email"}
+        user["enhancement_types"] = [
+            r["technique"] for r in db.execute(
+                "SELECT technique FROM enhancement_types WHERE email = ? ORDER BY rowid", (email,)
+            )
+        ]
+        user["enhancement_history"] = self.history(email, limit=history_limit)
+        return user
+
+    def history(self, email, limit=None):
+        # Oldest first, like the old JSON list; `limit` keeps the newest N
+        query = "SELECT technique, date, filename FROM enhancement_history WHERE email = ? ORDER BY id DESC"
+        params = (email,)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        rows = self._connection().execute(query, params).fetchall()
+        return [dict(r) for r in reversed(rows)]
+
+    # ANALYTICS
+
+    def revision(self, email):
+        # Changes whenever new activity is recorded; keys cached charts
+        row = self._connection().execute(
+            "SELECT enhancement_count FROM users WHERE email = ?", (email,)
+        ).fetchone()
+        return row["enhancement_count"] if row else 0
+
+    def technique_counts(self, email, start=None, end=None):
+        # Technique -> count in order of first use, over all time or within
+        # inclusive "YYYY-MM-DD" dates
+        if not (start or end):
+            query = "SELECT technique, count AS n FROM technique_counts WHERE email = ? ORDER BY rowid"
+            params = [email]
+        else:
+            window, params = _bucket_window(start, end)
+            query = (
+                "SELECT technique, SUM(count) AS n FROM technique_hourly WHERE email = ?"
+                f"{window} GROUP BY technique ORDER BY MIN(rowid)"
+            )
+            params = [email] + params
+        return {r["technique"]: r["n"] for r in self._connection().execute(query, params)}
+
+    def activity(self, email, start=None, end=None, granularity="hour"):
+        # (bucket, count) pairs, oldest first. `start`/`end` are inclusive
+        # "YYYY-MM-DD" dates; daily buckets are summed from the hourly ones.
+        column = "substr(bucket, 1, 10)" if granularity == "day" else "bucket"
+        window, params = _bucket_window(start, end)
+        query = (
+            f"SELECT {column} AS b, SUM(count) AS n FROM activity_hourly WHERE email = ?"
+            f"{window} GROUP BY b ORDER BY b"
+        )
+        return [(r["b"], r["n"]) for r in self._connection().execute(query, [email] + params)]
+
+    def activity_before(self, email, start):
+        row = self._connection().execute(
+            "SELECT COALESCE(SUM(count), 0) FROM activity_hourly WHERE email = ? AND bucket < ?",
+            (email, str(start))
+        ).fetchone()
+        return row[0]
+
+    def load_users(self):
+        return {
+            r["email"]: self.get_user(r["email"])
+            for r in self._connection().execute("SELECT email FROM users ORDER BY rowid")
+        }
+
+    # WRITES
+
+    def register_user(self, first_name, last_name, dob, email, password):
+        data = {
+            "first_name": first_name,
+            "last_name": last_name,
+            "dob": str(dob),
+            "password": password,
+            "join_date": datetime.now().strftime("%Y-%m-%d"),
+        }
+        with stage("store", op="register_user"), self._transaction() as db:
+            return self._insert_user(db, email, data, 0)
+
+    def record_enhancement(self, email, technique, filename=None, date=None):
+        date = date or datetime.now().strftime(HISTORY_DATE_FORMAT)
+        with stage("store", op="record_enhancement"), self._transaction() as db:
+            updated = db.execute(
+                "UPDATE users SET enhancement_count = enhancement_count + 1 WHERE email = ?", (email,)
+            ).rowcount
+            if not updated:
+                raise KeyError(email)
+            db.execute(
+                "INSERT OR IGNORE INTO enhancement_types (email, technique) VALUES (?, ?)",
+                (email, technique)
+            )
+            db.execute(
+                "INSERT INTO enhancement_history (email, technique, date, filename) VALUES (?, ?, ?, ?)",
+                (email, technique, date, filename)
+            )
+            db.execute(
+                "INSERT INTO technique_counts (email, technique, count) VALUES (?, ?, 1) "
+                "ON CONFLICT (email, technique) DO UPDATE SET count = count + 1",
+                (email, technique)
+            )
+            db.execute(
+                "INSERT INTO activity_hourly (email, bucket, count) VALUES (?, ?, 1) "
+                "ON CONFLICT (email, bucket) DO UPDATE SET count = count + 1",
+                (email, date[:13])
+            )
+            db.execute(
+                "INSERT INTO technique_hourly (email, bucket, technique, count) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (email, bucket, technique) DO UPDATE SET count = count + 1",
+                (email, date[:13], technique)
+            )
+
+    def _insert_user(self, db, email, data, enhancement_count):
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO users "
+            "(email, first_name, last_name, dob, password, enhancement_count, join_date) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                email, data["first_name"], data["last_name"], str(data["dob"]),
+                data["password"], enhancement_count, data["join_date"],
+            )
+        )
+        return cursor.rowcount == 1
+
+
+def _bucket_window(start, end):
+    # SQL condition on an hourly `bucket` column for inclusive dates
+    clause = ""
+    params = []
+    if start:
+        clause += " AND bucket >= ?"
+        params.append(str(start))
+    if end:
+        # "~" sorts after the " HH" suffix, so the whole end day is included
+        clause += " AND bucket <= ?"
+        params.append(f"{end}~")
+    return clause, params
+
+def _legacy_technique(entry):
+    # Early history entries stored the full UI label under "enhancement"
+    if "technique" in entry:
+        return entry["technique"]
+    return entry.get("enhancement", "Unknown").split(" ")[0]
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so two writers queue on
+    # the busy timeout instead of failing halfway through
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# Explicit migration, for deployments that want it done before the app starts:
+#   python -m enhancer.store users.json users.db
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m enhancer.store USERS_JSON USERS_DB")
+    store = UserStore(sys.argv[2])
+    print(f"Imported {store.migrate_from_json(sys.argv[1])} users into {sys.argv[2]}")
@@ -0,0 +1,258 @@
+# Streaming enhancement of multi-frame stacks and video.
+#
+#   python -m enhancer.stream scan_stack.tif -t Histogram -t Sharpening -o out.tif
+#   python -m enhancer.stream clip.mp4 --temporal-denoise 5 -o clean.mp4
+#
+# Frames flow through generators: read lazily from a multi-page TIFF (or any
+# format Pillow can seek through) or a video, enhanced on a thread pool, and
+# written out as they finish. At most --read-ahead frames are decoded ahead of
+# the writer, so memory depends on that and not on the length of the stack.
+# Frames are written in their original order.
+#
+# Temporal denoise uses each frame's neighbours instead of denoising it alone:
+# NL-means over a sliding window of `window` frames centred on it (OpenCV's
+# fastNlMeansDenoising*Multi). Near either end the window shrinks to fit.
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence, TiffImagePlugin
+
+from enhancer.codec import decode_image
+from enhancer.export import to_pil
+from enhancer.operations import to_uint8
+from enhancer.pipeline import run_pipeline
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+VIDEO_FOURCC = {".mp4": "mp4v", ".avi": "MJPG", ".mov": "mp4v", ".mkv": "XVID"}
+DEFAULT_FPS = 10.0
+
+DEFAULT_TEMPORAL_WINDOW = 5
+
+
+# READING
+
+def _is_video(source):
+    return isinstance(source, str) and source.lower().endswith(VIDEO_EXTENSIONS)
+
+def count_frames(source):
+    if _is_video(source):
+        capture = cv2.VideoCapture(source)
+        try:
+            return int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            capture.release()
+    with Image.open(source) as image:
+        return getattr(image, "n_frames", 1)
+
+def iter_frames(source):
+    # `source` is a path or a file object; frames decode natively (gray and
+    # 16-bit stay as they are), videos as 8-bit BGR
+    if _is_video(source):
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise IOError(f"Could not open video {source}")
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame
+        finally:
+            capture.release()
+    else:
+        with Image.open(source) as image:
+            for frame in ImageSequence.Iterator(image):
+                yield decode_image(frame)
+
+def video_fps(source):
+    if not _is_video(source):
+        return None
+    capture = cv2.VideoCapture(source)
+    try:
+        return capture.get(cv2.CAP_PROP_FPS) or None
+    finally:
+        capture.release()
+
+
+# PROCESSING
+
+def bounded_map(func, items, workers=None, read_ahead=None):
+    # Ordered, lazy map over a thread pool (OpenCV releases the GIL). No more
+    # than `read_ahead` items are pulled from `items` before their results
+    # have been consumed.
+    workers = workers or os.cpu_count() or 1
+    read_ahead = max(1, read_ahead or 2 * workers)
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame") as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= read_ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def sliding_windows(frames, window):
+    # Yields (frames, index) with frames[index] the frame to denoise and up to
+    # window // 2 neighbours on each side, fewer at the ends
+    half = window // 2
+    buffered = deque()
+    center = 0
+    start = 0
+    for frame in frames:
+        buffered.append(frame)
+        # The newest frame completes the window of the frame `half` before it
+        if start + len(buffered) - 1 >= center + half:
+            yield _window_at(buffered, start, center, min(center - start, half))
+            center += 1
+            # Drop frames no later window can use
+            while center - start > half:
+                buffered.popleft()
+                start += 1
+    end = start + len(buffered)
+    while center < end:
+        reach = min(center - start, end - 1 - center, half)
+        yield _window_at(buffered, start, center, reach)
+        center += 1
+
+def _window_at(buffered, start, center, reach):
+    first = center - start - reach
+    return [buffered[i] for i in range(first, first + 2 * reach + 1)], reach
+
+def denoise_window(window, h=10, template=7, search=21):
+    frames, index = window
+    size = len(frames)
+    frame = frames[index]
+    if frame.dtype != np.uint8:
+        return cv2.fastNlMeansDenoisingMulti(
+            frames, index, size, h=[h * np.iinfo(frame.dtype).max / 255],
+            templateWindowSize=template, searchWindowSize=search, normType=cv2.NORM_L1
+        )
+    if frame.ndim == 2:
+        return cv2.fastNlMeansDenoisingMulti(frames, index, size, None, h, template, search)
+    return cv2.fastNlMeansDenoisingColoredMulti(frames, index, size, None, h, h, template, search)
+
+def temporal_denoise(frames, window=DEFAULT_TEMPORAL_WINDOW, h=10, workers=None, read_ahead=None):
+    if window < 1 or window % 2 == 0:
+        raise ValueError(f"The temporal window must be an odd number of frames, got {window}")
+    return bounded_map(
+        lambda w: denoise_window(w, h=h), sliding_windows(frames, window),
+        workers=workers, read_ahead=read_ahead
+    )
+
+def enhance_frames(frames, steps, temporal_window=None, workers=None, read_ahead=None):
+    # Temporal denoise needs the untouched neighbours, so it runs first; the
+    # per-frame steps follow
+    if temporal_window:
+        frames = temporal_denoise(frames, temporal_window, workers=workers, read_ahead=read_ahead)
+    if steps:
+        frames = bounded_map(
+            lambda frame: run_pipeline(frame, steps), frames,
+            workers=workers, read_ahead=read_ahead
+        )
+    return frames
+
+
+# WRITING
+
+def write_tiff_stack(frames, target, compression=None):
+    # One page per frame, appended as each frame arrives. `target` is a path or
+    # a seekable binary file object. 16-bit gray pages keep their depth.
+    count = 0
+    with TiffImagePlugin.AppendingTiffWriter(target, new=True) as tiff:
+        for frame in frames:
+            options = {"compression": compression} if compression else {}
+            to_pil(frame, "TIFF").save(tiff, format="TIFF", **options)
+            tiff.newFrame()
+            count += 1
+    return count
+
+def write_video(frames, path, fps=DEFAULT_FPS):
+    # Video codecs are 8-bit; the writer opens once the first frame gives the size
+    writer = None
+    count = 0
+    try:
+        for frame in frames:
+            frame = to_uint8(frame)
+            if writer is None:
+                fourcc = cv2.VideoWriter_fourcc(*VIDEO_FOURCC[os.path.splitext(path)[1].lower()])
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(path, fourcc, fps, (width, height), frame.ndim == 3)
+                if not writer.isOpened():
+                    raise IOError(f"Could not open {path} for writing")
+            writer.write(frame)
+            count += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return count
+
+def write_frames(frames, path, fps=None, compression=None):
+    if _is_video(path):
+        return write_video(frames, path, fps or DEFAULT_FPS)
+    return write_tiff_stack(frames, path, compression)
+
+def enhance_stream(source, target, steps, temporal_window=None, workers=None, read_ahead=None,
+                   compression=None):
+    frames = enhance_frames(
+        iter_frames(source), steps, temporal_window=temporal_window,
+        workers=workers, read_ahead=read_ahead
+    )
+    if isinstance(target, str):
+        return write_frames(frames, target, fps=video_fps(source), compression=compression)
+    return write_tiff_stack(frames, target, compression)
+
+
+# CLI
+
+def main(argv=None):
+    from enhancer.registry import get_operation
+
+    parser = argparse.ArgumentParser(description="Enhance every frame of a multi-page TIFF or video")
+    parser.add_argument("input", help="multi-page TIFF (or any multi-frame image) or video")
+    parser.add_argument("-o", "--output", required=True, help=".tif/.tiff stack or a video file")
+    parser.add_argument("-t", "--technique", action="append", default=[],
+                        help="technique applied to each frame, in order (repeatable)")
+    parser.add_argument("--denoise-tier", default="quality",
+                        choices=["auto", "fast", "balanced", "quality", "parallel"])
+    parser.add_argument("--temporal-denoise", type=int, metavar="WINDOW", default=None,
+                        help="denoise each frame with its neighbours over an odd window of frames")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--read-ahead", type=int, default=None,
+                        help="frames decoded ahead of the writer (default: 2 x workers)")
+    parser.add_argument("--compression", default=None,
+                        help="TIFF compression, e.g. tiff_deflate or tiff_lzw (default: none)")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        steps = [get_operation(t).name for t in args.technique]
+    except KeyError as e:
+        parser.error(str(e))
+    if not steps and not args.temporal_denoise:
+        parser.error("nothing to do: pass -t and/or --temporal-denoise")
+    if args.temporal_denoise is not None and (args.temporal_denoise < 1 or args.temporal_denoise % 2 == 0):
+        parser.error("--temporal-denoise needs an odd number of frames")
+    steps = [(s, {"tier": args.denoise_tier} if s == "Denoise" else {}) for s in steps]
+
+    start = time.perf_counter()
+    count = enhance_stream(
+        args.input, args.output, steps, temporal_window=args.temporal_denoise,
+        workers=args.workers, read_ahead=args.read_ahead, compression=args.compression
+    )
+    if not args.quiet:
+        elapsed = time.perf_counter() - start
+        print(f"{count} frame(s) in {elapsed:.1f}s ({count / elapsed:.1f} frames/s) -> {args.output}",
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,61 @@
 import datetime
 import streamlit as st
-import cv2
-import numpy as np
-from PIL import Image
-import json
 import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
 from io import BytesIO
-from datetime import datetime
-from skimage.util import random_noise
 from streamlit_image_comparison import image_comparison
-import matplotlib.pyplot as plt
-import time
+
+from enhancer import (
+    DENOISE_TIERS,
+    bytes_key,
+    run_pipeline,
+    decode_image,
+    get_cache,
+    export_image,
+    get_image_store,
+    get_operation,
+    peek_export,
+    preview_pipeline,
+    technique_labels,
+    to_display,
+)
+from enhancer.analytics import user_charts
+from enhancer.cache import result_key
+from enhancer.jobs import DONE, FAILED, QueueFull, UserLimitReached, cancel_requested, get_queue
+from enhancer.metrics import get_metrics, request, stage, start_exporters_from_env
+from enhancer.registry import is_cacheable
+from enhancer.server import start_server_from_env
+from enhancer.store import UserStore
+from enhancer.stream import count_frames, enhance_stream
 
 # USER MANAGEMENT FUNCTIONS
 
+# Users live in an SQLite database; the legacy users.json is imported into it
+# the first time the app starts.
+USERS_DB = os.environ.get("ENHANCER_USERS_DB", "users.db")
 USERS_FILE = "users.json"
+CHART_WINDOW_DAYS = 90
+# Comma-separated emails allowed to see the Operations tab
+ADMIN_EMAILS = {e.strip() for e in os.environ.get("ENHANCER_ADMINS", "").split(",") if e.strip()}
+
+@st.cache_resource
+def get_user_store():
+    return UserStore(USERS_DB, legacy_json=USERS_FILE)
 
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return get_user_store().load_users()
 
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=4)
+def get_user(email, history_limit=None):
+    return get_user_store().get_user(email, history_limit=history_limit) or {}
 
 def authenticate(email, password):
-    users = st.session_state.users
-    return email in users and users[email]["password"] == password
+    return get_user_store().authenticate(email, password)
+
+def is_admin(email):
+    return email in ADMIN_EMAILS
 
 def calculate_age(dob):
     today = datetime.now()
@@ -36,81 +63,179 @@ def calculate_age(dob):
     return today.year - dob_date.year - ((today.month, today.day) < (dob_date.month, dob_date.day))
 
 def register_user(first_name, last_name, dob, email, password):
-    if email in st.session_state.users:
-        return False
-    
-    st.session_state.users[email] = {
-        "first_name": first_name,
-        "last_name": last_name,
-        "dob": str(dob),
-        "password": password,
-        "enhancement_count": 0,
-        "enhancement_types": [],
-        "enhancement_history": [],
-        "join_date": datetime.now().strftime("%Y-%m-%d")
-    }
-    save_users(st.session_state.users)
-    return True
-
-
-# IMAGE PROCESSING FUNCTIONS
-
-def apply_histogram_equalization(image):
-    if len(image.shape) == 2:
-        equalized = cv2.equalizeHist(image)
-        return cv2.cvtColor(equalized, cv2.COLOR_GRAY2RGB)
-    else:
-        img_yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
-        img_yuv[:,:,0] = cv2.equalizeHist(img_yuv[:,:,0])
-        return cv2.cvtColor(img_yuv, cv2.COLOR_YUV2RGB)
-
-def apply_gaussian_blur(image):
-    return cv2.GaussianBlur(image, (5, 5), 0)
-
-def apply_sharpening(image):
-    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-    return cv2.filter2D(image, -1, kernel)
-
-def apply_edge_detection(image):
-    edges = cv2.Canny(image, 100, 200)
-    return cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-
-def apply_complement(image):
-    img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    complement = cv2.bitwise_not(img_gray)
-    return cv2.cvtColor(complement, cv2.COLOR_GRAY2RGB)
-
-def apply_salt_and_pepper(image):
-    img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    noisy = random_noise(img_gray, mode='s&p', amount=0.05)
-    noisy = np.array(255 * noisy, dtype='uint8')
-    return cv2.cvtColor(noisy, cv2.COLOR_GRAY2RGB)
-
-def apply_denoise(image):
-    return cv2.fastNlMeansDenoisingColored(image, None, 10, 10, 7, 21)
-
-def image_to_bytes(image, format):
-    buf = BytesIO()
-    image.save(buf, format=format)
-    return buf.getvalue()
+    return get_user_store().register_user(first_name, last_name, dob, email, password)
+
+
+# METRICS
+# Per-stage timings are collected by the engine; this starts the Prometheus
+# exporters configured by ENHANCER_METRICS_PORT / ENHANCER_METRICS_FILE once
+# per server process.
+
+@st.cache_resource
+def start_metrics_exporters():
+    return start_exporters_from_env()
+
+start_metrics_exporters()
+
+
+# HTTP API
+# Served next to the app when ENHANCER_API_PORT is set, sharing its user
+# store and worker pool; see enhancer/server.py.
+
+@st.cache_resource
+def start_api_server():
+    return start_server_from_env(get_user_store())
+
+start_api_server()
+
+
+# ENHANCEMENT JOBS
+# Runs on the shared worker pool, not in the script thread, so it records
+# history itself and finishes even if the user navigates away.
+
+# How long a script run waits on a pending job before rerunning to refresh its
+# status; it returns as soon as the job finishes
+JOB_POLL_S = 1.0
+
+def render_key(source, recipe):
+    # Deterministic recipes get a content key, so identical renders in
+    # different sessions share one stored image (and its encoded exports)
+    if all(is_cacheable(get_operation(step), params) for step, params in recipe):
+        return result_key(source.key, "render", {"steps": recipe})
+    return uuid.uuid4().hex
+
+def render_enhancement(store, images, source, recipe, email, filename):
+    # The result goes into the image store and the job returns its handle, so
+    # finished jobs don't keep full-resolution arrays alive. It bypasses the
+    # result cache: the store must be the only owner, or spilling it would
+    # free nothing. The store's render_key dedup stands in for the cache.
+    with request("enhance", user=email, filename=filename):
+        key = render_key(source, recipe)
+        handle = images.handle(key)
+        if handle is None:
+            image = images.get(source)
+            if image is None:
+                raise RuntimeError("The original image is no longer available, please upload it again")
+            result = run_pipeline(image, recipe)
+        # A cancelled render's result is dropped, so it doesn't count either
+        if cancel_requested():
+            return None
+        if handle is None:
+            handle = images.put(key, result)
+        for step, _ in recipe:
+            store.record_enhancement(email, get_operation(step).name, filename)
+    return handle
+
+# Enhanced stacks are kept this long for their session to download
+STACK_TTL_S = 3600
+# Frame threads per stack; the job already occupies one of the queue's
+# workers, and OpenCV spreads each frame over its own threads
+STACK_WORKERS = 2
+
+def stack_dir():
+    # Next to the image store's spilled arrays, and removed with them
+    path = os.path.join(get_image_store().spill_dir, "stacks")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def prune_stacks(ttl_s=STACK_TTL_S):
+    # Abandoned sessions never call discard_stack(), so old stacks go by age
+    cutoff = time.time() - ttl_s
+    for entry in os.scandir(stack_dir()):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def render_stack(store, data, recipe, temporal_window, email, filename):
+    # Streams every frame of a multi-page upload into a TIFF on disk and
+    # returns its path; with a temporal window, Denoise uses neighbouring
+    # frames instead of running per frame
+    prune_stacks()
+    fd, path = tempfile.mkstemp(prefix="enhancer-stack-", suffix=".tif", dir=stack_dir())
+    os.close(fd)
+    steps = [
+        (step, params) for step, params in recipe
+        if not (temporal_window and get_operation(step).name == "Denoise")
+    ]
+    try:
+        with request("stack", user=email, filename=filename):
+            enhance_stream(
+                BytesIO(data), path, steps, temporal_window=temporal_window, workers=STACK_WORKERS
+            )
+            if cancel_requested():
+                os.remove(path)
+                return None
+            for step, _ in recipe:
+                store.record_enhancement(email, get_operation(step).name, filename)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def discard_stack():
+    if st.session_state.stack_path:
+        try:
+            os.remove(st.session_state.stack_path)
+        except OSError:
+            # Already pruned
+            pass
+    prune_stacks()
+    st.session_state.stack_path = None
+    st.session_state.stack_recipe = None
 
 
 # SESSION STATE INITIALIZATION
 
-if "users" not in st.session_state:
-    st.session_state.users = load_users()
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 if "current_user" not in st.session_state:
     st.session_state.current_user = None
-if "enhanced_image" not in st.session_state:
-    st.session_state.enhanced_image = None
-if "original_image" not in st.session_state:
-    st.session_state.original_image = None
+# Images are ImageHandles into the process-wide image store, not arrays
+if "enhanced_handle" not in st.session_state:
+    st.session_state.enhanced_handle = None
+if "original_handle" not in st.session_state:
+    st.session_state.original_handle = None
+if "enhanced_recipe" not in st.session_state:
+    st.session_state.enhanced_recipe = None
 if "tab_selection" not in st.session_state:
     st.session_state.tab_selection = "Enhancement"
 if "show_success" not in st.session_state:
     st.session_state.show_success = False
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
+if "job_recipe" not in st.session_state:
+    st.session_state.job_recipe = None
+if "job_kind" not in st.session_state:
+    st.session_state.job_kind = None
+if "original_frames" not in st.session_state:
+    st.session_state.original_frames = 1
+if "stack_path" not in st.session_state:
+    st.session_state.stack_path = None
+if "stack_recipe" not in st.session_state:
+    st.session_state.stack_recipe = None
+if "flash" not in st.session_state:
+    st.session_state.flash = None
+
+pending_job = None
+
+
+# FLASH MESSAGES
+# Queued by an action right before st.rerun() and shown once on the next run,
+# instead of sleeping so the message stays on screen
+
+def flash(message, effect=None):
+    st.session_state.flash = (message, effect)
+
+if st.session_state.flash:
+    message, effect = st.session_state.flash
+    st.session_state.flash = None
+    st.success(message)
+    if effect == "snow":
+        st.snow()
+    elif effect == "balloons":
+        st.balloons()
 
 
 
@@ -128,7 +253,7 @@ with st.sidebar:
         
         st.markdown("</div>", unsafe_allow_html=True)
     else:
-        user_data = st.session_state.users.get(st.session_state.current_user, {})
+        user_data = get_user(st.session_state.current_user, history_limit=0)
         st.markdown(f"""
         <div class="custom-card">
             <div style="text-align: center;">
@@ -142,18 +267,21 @@ with st.sidebar:
         
         st.session_state.tab_selection = st.radio(
             "Navigation",
-            ["Enhancement", "My Profile", "Charts"],
+            ["Enhancement", "My Profile", "Charts"] + (["Operations"] if is_admin(st.session_state.current_user) else []),
             label_visibility="visible"
         )
         
         if st.button("🚪 Logout", key="logout_btn"):
             st.session_state.authenticated = False
             st.session_state.current_user = None
-            st.session_state.original_image = None
-            st.session_state.enhanced_image = None
+            st.session_state.original_handle = None
+            st.session_state.enhanced_handle = None
+            st.session_state.enhanced_recipe = None
             st.session_state.tab_selection = "Enhancement"
-            st.success("Logged out successfully!")
-            time.sleep(1)
+            st.session_state.job_id = None
+            st.session_state.original_frames = 1
+            discard_stack()
+            flash("Logged out successfully!")
             st.rerun()
 
 
@@ -191,13 +319,11 @@ if not st.session_state.authenticated:
                     st.error("Please fill in all fields")
                 elif password != confirm_password:
                     st.error("Passwords do not match")
-                elif email in st.session_state.users:
+                elif get_user_store().exists(email):
                     st.error("Email already registered")
                 else:
                     if register_user(first_name, last_name, dob, email, password):
-                        st.success("Account created successfully! Please log in.")
-                        st.balloons()
-                        time.sleep(1.5)
+                        flash("Account created successfully! Please log in.", "balloons")
                         st.rerun()
             
             st.markdown("</div>", unsafe_allow_html=True)
@@ -221,9 +347,7 @@ if not st.session_state.authenticated:
                     st.session_state.authenticated = True
                     st.session_state.current_user = email
                     st.session_state.show_success = True
-                    st.success("Login successful!")
-                    st.snow()
-                    time.sleep(1)
+                    flash("Login successful!", "snow")
                     st.rerun()
                 else:
                     st.error("Invalid email or password")
@@ -234,7 +358,8 @@ if not st.session_state.authenticated:
 # MAIN APPLICATION PAGES
 
 else:
-    user_data = st.session_state.users.get(st.session_state.current_user, {})
+    # The profile shows the last 5 entries; charts read aggregates instead
+    user_data = get_user(st.session_state.current_user, history_limit=5)
     
     # ENHANCEMENT TAB
     if st.session_state.tab_selection == "Enhancement":
@@ -247,87 +372,208 @@ else:
             
             uploaded_file = st.file_uploader(
                 "Choose an image file", 
-                type=["jpg", "jpeg", "png", "bmp", "tiff"],
+                type=["jpg", "jpeg", "png", "bmp", "tif", "tiff"],
                 label_visibility="collapsed"
             )
             
             if uploaded_file is not None:
                 try:
-                    image = Image.open(uploaded_file)
-                    image_np = np.array(image.convert("RGB"))
-                    st.session_state.original_image = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+                    data = uploaded_file.getvalue()
+                    with request("upload", user=st.session_state.current_user, filename=uploaded_file.name):
+                        # The same file uploaded in another session is decoded once
+                        st.session_state.original_handle = get_image_store().get_or_put(
+                            bytes_key(data), lambda: decode_image(BytesIO(data))
+                        )
+                        # Only TIFF stacks; a phone JPEG can be a two-frame MPO
+                        is_stack = uploaded_file.name.lower().endswith((".tif", ".tiff"))
+                        st.session_state.original_frames = count_frames(BytesIO(data)) if is_stack else 1
                     
-                    st.image(image, caption="Original Image", use_column_width=True)
+                    st.image(get_image_store().display(st.session_state.original_handle),
+                             caption="Original Image", use_column_width=True)
                 except Exception as e:
                     st.error(f"Error loading image: {str(e)}")
             
-            if st.session_state.original_image is not None:
-                enhancement_option = st.selectbox(
-                    "Select Enhancement Type",
-                    [
-                        "Histogram Equalization (Contrast)",
-                        "Gaussian Blur (Smoothing)",
-                        "Sharpening (Detail Enhancement)",
-                        "Edge Detection (Feature Extraction)",
-                        "Complement (Invert Colors)",
-                        "Salt & Pepper Noise (Film Grain)",
-                        "Denoise (Noise Reduction)"
-                    ],
-                    index=0
+            # Entries the image store has dropped must be uploaded or rendered again
+            images = get_image_store()
+            for name in ("original_handle", "enhanced_handle"):
+                handle = st.session_state[name]
+                if handle is not None and images.handle(handle.key) is None:
+                    st.session_state[name] = None
+                    if name == "enhanced_handle":
+                        st.session_state.enhanced_recipe = None
+            
+            recipe_id = None
+            if st.session_state.original_handle is not None:
+                enhancement_steps = st.multiselect(
+                    "Select Enhancement Steps (applied in the order chosen)",
+                    technique_labels(),
+                    default=technique_labels()[:1]
                 )
                 
-                if st.button("Apply Enhancement", key="enhance_btn"):
-                    with st.spinner("Processing image..."):
+                step_params = {}
+                if any(get_operation(step).name == "Denoise" for step in enhancement_steps):
+                    step_params["Denoise"] = {"tier": st.selectbox(
+                        "Denoise speed / quality",
+                        ["auto"] + list(DENOISE_TIERS),
+                        index=0,
+                        help="auto picks the best tier that finishes within about 2 seconds for this image size"
+                    )}
+                if any(get_operation(step).name == "Salt" for step in enhancement_steps):
+                    col1, col2, col3 = st.columns(3)
+                    step_params["Salt"] = {
+                        "amount": col1.slider("Noise amount", 0.0, 0.5, 0.05, 0.01),
+                        "salt_vs_pepper": col2.slider("Salt vs. pepper", 0.0, 1.0, 0.5, 0.05),
+                    }
+                    # Unseeded by default: fresh noise on every render, never cached
+                    seed = col3.text_input("Noise seed", value="", placeholder="random",
+                                           help="Optional. The same seed gives the same noise").strip()
+                    if seed.isdigit():
+                        step_params["Salt"]["seed"] = int(seed)
+                    elif seed:
+                        col3.warning("The seed must be a whole number; using random noise")
+                recipe = [(step, step_params.get(get_operation(step).name, {})) for step in enhancement_steps]
+                recipe_id = repr((st.session_state.original_handle.key, recipe))
+                
+                # Collect the background render once it has finished
+                job = get_queue().get(st.session_state.job_id) if st.session_state.job_id else None
+                if st.session_state.job_id and job is None:
+                    st.session_state.job_id = None
+                elif job is not None and job.done:
+                    st.session_state.job_id = None
+                    if job.status == DONE and st.session_state.job_kind == "stack":
+                        discard_stack()
+                        st.session_state.stack_path = job.result
+                        st.session_state.stack_recipe = st.session_state.job_recipe
+                        st.success("All frames enhanced successfully!")
+                    elif job.status == DONE:
+                        st.session_state.enhanced_handle = job.result
+                        st.session_state.enhanced_recipe = st.session_state.job_recipe
+                        st.success("Enhancement applied successfully!")
+                    elif job.status == FAILED:
+                        st.error(f"Error during enhancement: {str(job.error)}")
+                elif job is not None:
+                    position = get_queue().position(job.id)
+                    if position:
+                        st.info(f"⏳ Queued – {position} enhancement(s) ahead of yours")
+                    else:
+                        st.info("⚙️ Processing image...")
+                    if st.button("Cancel", key="cancel_job_btn"):
+                        get_queue().cancel(job.id)
+                        st.session_state.job_id = None
+                        st.rerun()
+                    pending_job = job
+                
+                # Until the user confirms, show the recipe on a display-sized
+                # proxy instead of rendering every full-resolution pixel
+                if enhancement_steps and st.session_state.enhanced_recipe != recipe_id:
+                    try:
+                        with request("preview", user=st.session_state.current_user):
+                            source = st.session_state.original_handle
+                            proxy, proxy_result = preview_pipeline(
+                                images.get(source), recipe, source_key=source.key
+                            )
+                            st.markdown("### Preview")
+                            with stage("compare"):
+                                image_comparison(
+                                    img1=to_display(proxy),
+                                    img2=to_display(proxy_result),
+                                    label1="Original",
+                                    label2="Preview",
+                                    width=700,
+                                    starting_position=50
+                                )
+                        st.caption("Reduced-resolution preview. Apply the enhancement to render full resolution and download.")
+                    except Exception as e:
+                        st.error(f"Error during preview: {str(e)}")
+                
+                if st.button("Apply Enhancement", key="enhance_btn",
+                             disabled=not enhancement_steps or pending_job is not None):
+                    try:
+                        job = get_queue().submit(
+                            st.session_state.current_user,
+                            render_enhancement,
+                            get_user_store(),
+                            images,
+                            st.session_state.original_handle,
+                            recipe,
+                            st.session_state.current_user,
+                            uploaded_file.name if uploaded_file else "unknown"
+                        )
+                        st.session_state.job_id = job.id
+                        st.session_state.job_recipe = recipe_id
+                        st.session_state.job_kind = "image"
+                        st.rerun()
+                    except (QueueFull, UserLimitReached) as e:
+                        st.warning(str(e))
+                
+                # Multi-page uploads: the steps above work on the first frame;
+                # this renders the whole stack, streaming frame by frame
+                if uploaded_file is not None and st.session_state.original_frames > 1:
+                    st.markdown("### Frame Stack")
+                    st.caption(f"This file has {st.session_state.original_frames} frames. "
+                               "The preview and Apply Enhancement use the first one.")
+                    temporal_window = None
+                    if "Denoise" in step_params and st.checkbox(
+                        "Temporal denoise", key="temporal_denoise",
+                        help="Denoise each frame together with its neighbours instead of on its own"
+                    ):
+                        temporal_window = st.slider("Temporal window (frames)", 3, 9, 5, step=2)
+                    stack_recipe_id = repr(("stack", recipe_id, temporal_window))
+                    
+                    if st.button("Enhance All Frames", key="enhance_stack_btn",
+                                 disabled=not enhancement_steps or pending_job is not None):
                         try:
-                            img = st.session_state.original_image
-                            if "Histogram" in enhancement_option: 
-                                result = apply_histogram_equalization(img)
-                            elif "Gaussian" in enhancement_option: 
-                                result = apply_gaussian_blur(img)
-                            elif "Sharpening" in enhancement_option: 
-                                result = apply_sharpening(img)
-                            elif "Edge" in enhancement_option: 
-                                result = apply_edge_detection(img)
-                            elif "Complement" in enhancement_option: 
-                                result = apply_complement(img)
-                            elif "Salt" in enhancement_option: 
-                                result = apply_salt_and_pepper(img)
-                            elif "Denoise" in enhancement_option: 
-                                result = apply_denoise(img)
-                            
-                            st.session_state.enhanced_image = result
-                            
-                            # Update user stats
-                            user_data["enhancement_count"] += 1
-                            tech_name = enhancement_option.split(" ")[0]
-                            if tech_name not in user_data["enhancement_types"]:
-                                user_data["enhancement_types"].append(tech_name)
-                            user_data["enhancement_history"].append({
-                                "technique": tech_name,
-                                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "filename": uploaded_file.name if uploaded_file else "unknown"
-                            })
-                            save_users(st.session_state.users)
-                            
-                            st.success("Enhancement applied successfully!")
-                            time.sleep(0.5)
+                            job = get_queue().submit(
+                                st.session_state.current_user,
+                                render_stack,
+                                get_user_store(),
+                                uploaded_file.getvalue(),
+                                recipe,
+                                temporal_window,
+                                st.session_state.current_user,
+                                uploaded_file.name
+                            )
+                            st.session_state.job_id = job.id
+                            st.session_state.job_recipe = stack_recipe_id
+                            st.session_state.job_kind = "stack"
                             st.rerun()
-                        except Exception as e:
-                            st.error(f"Error during enhancement: {str(e)}")
+                        except (QueueFull, UserLimitReached) as e:
+                            st.warning(str(e))
+                    
+                    stack_path = st.session_state.stack_path
+                    if stack_path and st.session_state.stack_recipe == stack_recipe_id:
+                        try:
+                            with open(stack_path, "rb") as f:
+                                size = os.fstat(f.fileno()).st_size
+                                st.download_button(
+                                    "Download Enhanced Stack (TIFF)",
+                                    data=f,
+                                    file_name="enhanced_stack.tif",
+                                    mime="image/tiff"
+                                )
+                            st.caption(f"{size / 2**20:,.1f} MB")
+                        except OSError:
+                            # Pruned once it outlived STACK_TTL_S
+                            st.session_state.stack_path = None
+                            st.info("The enhanced stack has expired, please enhance it again.")
             
-            if st.session_state.enhanced_image is not None:
-                original_rgb = cv2.cvtColor(st.session_state.original_image, cv2.COLOR_BGR2RGB)
-                enhanced_rgb = cv2.cvtColor(st.session_state.enhanced_image, cv2.COLOR_BGR2RGB)
+            if st.session_state.enhanced_handle is not None and st.session_state.enhanced_recipe == recipe_id:
+                # Display-sized 8-bit derivatives, made once per stored image;
+                # the full-resolution arrays aren't touched
+                original_rgb = images.display(st.session_state.original_handle)
+                enhanced_rgb = images.display(st.session_state.enhanced_handle)
                 
                 st.markdown("### Comparison Viewer")
-                image_comparison(
-                    img1=original_rgb, 
-                    img2=enhanced_rgb, 
-                    label1="Original", 
-                    label2="Enhanced",
-                    width=700,
-                    starting_position=50
-                )
+                with request("compare", user=st.session_state.current_user), stage("compare") as span:
+                    span.record(enhanced_rgb)
+                    image_comparison(
+                        img1=original_rgb, 
+                        img2=enhanced_rgb, 
+                        label1="Original", 
+                        label2="Enhanced",
+                        width=700,
+                        starting_position=50
+                    )
                 
                 st.markdown("### Download Options")
                 download_format = st.selectbox(
@@ -337,27 +583,54 @@ else:
                     key="download_format"
                 )
                 
+                # Nothing is encoded until asked for; each format/settings
+                # combination is encoded once and reused across reruns
                 if download_format == "PNG":
-                    dl_btn = st.download_button(
-                        "Download PNG",
-                        data=image_to_bytes(Image.fromarray(enhanced_rgb), 'PNG'),
-                        file_name="enhanced.png",
-                        mime="image/png"
-                    )
+                    export_settings = {"compress_level": st.slider(
+                        "Compression level", 0, 9, 6, key="png_compress_level",
+                        help="Higher is smaller but slower; PNG is lossless at every level"
+                    )}
                 elif download_format == "JPEG":
-                    dl_btn = st.download_button(
-                        "Download JPEG",
-                        data=image_to_bytes(Image.fromarray(enhanced_rgb), 'JPEG'),
-                        file_name="enhanced.jpg",
-                        mime="image/jpeg"
-                    )
-                elif download_format == "WebP":
-                    dl_btn = st.download_button(
-                        "Download WebP",
-                        data=image_to_bytes(Image.fromarray(enhanced_rgb), 'WEBP'),
-                        file_name="enhanced.webp",
-                        mime="image/webp"
-                    )
+                    export_settings = {
+                        "quality": st.slider("Quality", 1, 95, 75, key="jpeg_quality"),
+                        "progressive": st.checkbox("Progressive", key="jpeg_progressive"),
+                    }
+                else:
+                    lossless = st.checkbox("Lossless", key="webp_lossless")
+                    export_settings = {
+                        "quality": st.slider("Quality", 1, 100, 80, key="webp_quality"),
+                        "method": st.slider("Effort", 0, 6, 4, key="webp_method",
+                                            help="Higher is smaller but slower"),
+                        "lossless": lossless,
+                    }
+                
+                enhanced = st.session_state.enhanced_handle
+                export = peek_export(enhanced.key, download_format, **export_settings)
+                if export is None and st.button(f"Prepare {download_format} download", key="prepare_export_btn"):
+                    enhanced_image = images.get(enhanced)
+                    if enhanced_image is None:
+                        # Dropped from the image store since this run started
+                        st.session_state.enhanced_handle = None
+                        st.session_state.enhanced_recipe = None
+                        st.info("This result is no longer available on the server. Apply the enhancement again to download it.")
+                    else:
+                        with st.spinner(f"Encoding {download_format}..."), \
+                                request("export", user=st.session_state.current_user):
+                            export = export_image(
+                                enhanced_image, enhanced.key,
+                                download_format, **export_settings
+                            )
+                if export is not None:
+                    # Pinned while Streamlit copies it, so a memo eviction by
+                    # another session can't delete a spooled file mid-read
+                    with export, export.open() as f:
+                        dl_btn = st.download_button(
+                            f"Download {download_format}",
+                            data=f,
+                            file_name=f"enhanced.{export.extension}",
+                            mime=export.mime
+                        )
+                    st.caption(f"{export.size / 1024:,.0f} KB • encoded in {export.encode_s * 1000:.0f} ms")
             
             st.markdown("</div>", unsafe_allow_html=True)
     
@@ -419,34 +692,94 @@ else:
             """, unsafe_allow_html=True)
             
             if user_data.get("enhancement_count", 0) > 0:
+                today = datetime.now().date()
+                window = st.date_input(
+                    "Date range",
+                    value=(today - timedelta(days=CHART_WINDOW_DAYS), today),
+                    max_value=today
+                )
+                # The picker returns a single date while a range is being
+                # chosen, and nothing once it is cleared
+                if len(window) == 2:
+                    start, end = window
+                elif window:
+                    start = end = window[0]
+                else:
+                    start = end = None
+                
+                technique_png, timeline_png = user_charts(
+                    get_user_store(), st.session_state.current_user, start, end
+                )
+                
                 # Enhancement type distribution
-                enhancement_types = [h["technique"] for h in user_data.get("enhancement_history", [])]
-                if enhancement_types:
-                    type_counts = {t: enhancement_types.count(t) for t in set(enhancement_types)}
-                    
+                if technique_png:
                     st.markdown("### Technique Usage")
-                    fig1, ax1 = plt.subplots(figsize=(8, 4))
-                    ax1.bar(type_counts.keys(), type_counts.values(), color='#1976d2')
-                    ax1.set_title('Enhancement Techniques Used')
-                    ax1.set_ylabel('Count')
-                    plt.xticks(rotation=45)
-                    st.pyplot(fig1)
-                    
-                    # Timeline visualization
-                    st.markdown("### Activity Timeline")
-                    dates = [datetime.strptime(h["date"], "%Y-%m-%d %H:%M:%S") for h in user_data["enhancement_history"]]
-                    dates.sort()
-                    
-                    fig2, ax2 = plt.subplots(figsize=(8, 4))
-                    ax2.plot(dates, range(1, len(dates)+1), marker='o', color='#e53935')
-                    ax2.set_title('Enhancement Activity Over Time')
-                    ax2.set_ylabel('Total Enhancements')
-                    plt.xticks(rotation=45)
-                    st.pyplot(fig2)
+                    st.image(technique_png)
+                
+                # Timeline visualization
+                st.markdown("### Activity Timeline")
+                if timeline_png:
+                    st.image(timeline_png)
+                else:
+                    st.info("No enhancements in this date range.")
             else:
                 st.info("No enhancement data available yet. Process some images to see analytics.")
             
             st.markdown("</div>", unsafe_allow_html=True)
+    
+    # OPERATIONS TAB (ADMINS ONLY)
+    elif st.session_state.tab_selection == "Operations" and is_admin(st.session_state.current_user):
+        with st.container():
+            st.markdown("""
+            <div class="custom-card animate-fade">
+                <h2>🛠️ Operations</h2>
+                <p style="color: #546e7a;">Worker queue and cache health for this server process</p>
+            """, unsafe_allow_html=True)
+            
+            queue_metrics = get_queue().metrics()
+            st.markdown("### Enhancement Queue")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Queued", queue_metrics["queued"])
+            col2.metric("Running", f"{queue_metrics['running']} / {queue_metrics['workers']}")
+            col3.metric("Wait p95", f"{queue_metrics['wait_p95_s']:.2f}s")
+            col4.metric("Run p95", f"{queue_metrics['run_p95_s']:.2f}s")
+            st.json(queue_metrics)
+            
+            st.markdown("### Result Cache")
+            st.json(get_cache().stats())
+            
+            st.markdown("### Image Store")
+            st.caption("Uploads and rendered results shared by every session; cold images spill to memory-mapped files.")
+            st.json(get_image_store().stats())
+            
+            metrics = get_metrics()
+            st.markdown("### Stage Timings")
+            st.caption("Percentiles are histogram bucket upper bounds. Prometheus format: set ENHANCER_METRICS_PORT or ENHANCER_METRICS_FILE.")
+            stage_rows = metrics.stage_summary()
+            if stage_rows:
+                st.dataframe(stage_rows, use_container_width=True)
+            else:
+                st.info("No stages recorded yet.")
+            
+            st.markdown(f"### Slow Requests (≥ {metrics.slow_request_s:g}s)")
+            slow = metrics.slow_requests()
+            if slow:
+                st.dataframe(
+                    [{k: r[k] for k in ("time", "kind", "user", "seconds")} | {
+                        "slowest stage": max(r["stages"], key=r["stages"].get) if r["stages"] else ""
+                     } for r in slow],
+                    use_container_width=True
+                )
+                for r in slow[:10]:
+                    with st.expander(f"{r['time']} • {r['kind']} • {r['user']} • {r['seconds']:.2f}s"):
+                        st.json(r["spans"])
+            else:
+                st.info("No slow requests recorded.")
+            
+            if st.button("Refresh", key="ops_refresh_btn"):
+                st.rerun()
+            
+            st.markdown("</div>", unsafe_allow_html=True)
 
 
 st.markdown("""
@@ -454,4 +787,11 @@ st.markdown("""
     <hr style="border: 0.5px solid #cfd8dc;">
     <p>Image Enhancement Pro • {year}</p>
 </div>
-""".format(year=datetime.now().year), unsafe_allow_html=True)
\ No newline at end of file
+""".format(year=datetime.now().year), unsafe_allow_html=True)
+
+
+# Keep the page live while a render is in flight: block until it finishes or
+# the poll interval passes, then rerun to show the result or fresh status
+if pending_job is not None:
+    pending_job.wait(JOB_POLL_S)
+    st.rerun()
\ No newline at end of file
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from enhancer.batch import build_jobs, collect_inputs, output_path
+
+
+def _touch(root, *paths):
+    for path in paths:
+        full = root / path
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_bytes(b"")
+
+
+def _outputs(inputs, output_dir):
+    jobs, _ = build_jobs(inputs, [("Histogram",)], str(output_dir), "png")
+    return [target for _, targets, _, _ in jobs for _, target in targets]
+
+
+def test_glob_mirrors_tree_below_its_root(tmp_path):
+    _touch(tmp_path, "g/a/x.png", "g/b/x.png", "g/y.png")
+    inputs = collect_inputs([str(tmp_path / "g" / "**" / "*.png")])
+    stems = sorted(stem for _, stem in inputs)
+    assert stems == [os.path.join("a", "x"), os.path.join("b", "x"), "y"]
+    outputs = _outputs(inputs, tmp_path / "out")
+    assert len(set(outputs)) == len(outputs) == 3
+    assert str(tmp_path / "out" / "a" / "x_histogram.png") in outputs
+
+
+def test_recursive_directory_mirrors_tree(tmp_path):
+    _touch(tmp_path, "g/a/x.png", "g/b/x.png")
+    inputs = collect_inputs([str(tmp_path / "g")], recursive=True)
+    outputs = _outputs(inputs, tmp_path / "out")
+    assert len(set(outputs)) == 2
+
+
+def test_same_name_in_two_directory_inputs_fails_up_front(tmp_path):
+    _touch(tmp_path, "g/a/x.png", "g/b/x.png")
+    with pytest.raises(ValueError, match="same outputs"):
+        collect_inputs([str(tmp_path / "g" / "a"), str(tmp_path / "g" / "b")])
+
+
+def test_same_stem_different_extension_fails_up_front(tmp_path):
+    _touch(tmp_path, "d/x.png", "d/x.jpg")
+    with pytest.raises(ValueError, match="same outputs"):
+        collect_inputs([str(tmp_path / "d")])
+
+
+def test_overlapping_inputs_are_deduplicated(tmp_path):
+    _touch(tmp_path, "d/x.png")
+    inputs = collect_inputs([str(tmp_path / "d"), str(tmp_path / "d" / "*.png")])
+    assert len(inputs) == 1
+
+
+def test_output_path_names_recipe():
+    assert output_path("out", "sub/x", ("Histogram", "Denoise"), "PNG") == os.path.join(
+        "out", "sub/x_histogram-denoise.png"
+    )
@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+import pytest
+
+from enhancer.denoise import DEFAULT_TIER_MS_PER_MP, choose_tier, tier_costs_from_report
+
+BASELINE = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "denoise_baseline.json")
+
+
+def test_defaults_match_committed_baseline():
+    measured = tier_costs_from_report(BASELINE)
+    assert measured
+    for tier, cost in measured.items():
+        assert DEFAULT_TIER_MS_PER_MP[tier] == pytest.approx(cost, rel=0.01)
+
+
+def test_parallel_is_not_assumed_faster_than_quality():
+    assert DEFAULT_TIER_MS_PER_MP["parallel"] >= DEFAULT_TIER_MS_PER_MP["quality"]
+
+
+@pytest.mark.skipif("ENHANCER_DENOISE_COSTS" in os.environ, reason="costs come from a local report")
+@pytest.mark.parametrize("megapixels, tier", [(0.5, "quality"), (1.0, "balanced"), (4.0, "fast")])
+def test_auto_picks_best_tier_within_budget(megapixels, tier):
+    side = int((megapixels * 1e6) ** 0.5)
+    image = np.zeros((side, side, 3), dtype=np.uint8)
+    assert choose_tier(image, budget_s=2.0) == tier
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from enhancer.imagestore import ImageStore
+
+MB = 2**20
+
+
+def _image(value, side=1024):
+    # 3 MB of 8-bit BGR
+    return np.full((side, side, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ImageStore(max_bytes=7 * MB, spill_dir=str(tmp_path), idle_s=3600)
+    yield store
+    store.close()
+
+
+def _in_memory_bytes(store):
+    return sum(
+        (e.image.nbytes if e.in_memory else 0) + e.display_bytes
+        for e in store._entries.values()
+    )
+
+
+def test_put_spills_least_recently_used_first(store):
+    a = store.put("a", _image(1))
+    b = store.put("b", _image(2))
+    store.get(a)
+    store.put("c", _image(3))
+    stats = store.stats()
+    assert stats["spills"] == 1
+    assert not store._entries["b"].in_memory
+    assert store._entries["a"].in_memory
+    assert stats["memory_bytes"] == _in_memory_bytes(store) <= store.max_bytes
+    assert np.array_equal(store.get(b), _image(2))
+
+
+def test_same_key_is_stored_once(store):
+    first = store.put("a", _image(1))
+    assert store.put("a", _image(1)) == first
+    assert store.stats()["dedup_hits"] == 1
+    assert store.stats()["memory_bytes"] == 3 * MB
+
+
+def test_display_is_counted_and_dropped_on_spill(store):
+    a = store.put("a", _image(1))
+    display = store.display(a)
+    assert display.shape[:2] == (700, 700)
+    assert store.stats()["memory_bytes"] == 3 * MB + display.nbytes
+
+    store.put("b", _image(2))
+    store.put("c", _image(3))
+    assert not store._entries["a"].in_memory
+    assert store._entries["a"].display is None
+    assert store.stats()["memory_bytes"] == _in_memory_bytes(store) == 6 * MB
+
+
+def test_displays_of_spilled_entries_do_not_pin_memory(store):
+    handles = [store.put(str(i), _image(i)) for i in range(6)]
+    for _ in range(3):
+        for handle in handles:
+            assert store.display(handle) is not None
+            assert store.stats()["memory_bytes"] == _in_memory_bytes(store) <= store.max_bytes
+    # The displays are reclaimable, so a new entry only pushes out what it needs
+    store.put("new", _image(9))
+    assert store._entries["new"].in_memory
+    assert store.stats()["memory_bytes"] == _in_memory_bytes(store) <= store.max_bytes
+
+
+def test_small_8bit_image_is_its_own_display(store):
+    handle = store.put("small", np.zeros((100, 100), dtype=np.uint8))
+    store.display(handle)
+    assert store.stats()["memory_bytes"] == 100 * 100
+
+
+def test_discard_and_clear_release_everything(store):
+    handles = [store.put(str(i), _image(i)) for i in range(4)]
+    store.display(handles[-1])
+    store.discard(handles[0])
+    store.clear()
+    stats = store.stats()
+    assert stats["entries"] == 0
+    assert stats["memory_bytes"] == 0
+    assert stats["disk_bytes"] == 0
+
+
+def test_disk_cap_evicts_coldest_spilled_entries(tmp_path):
+    store = ImageStore(max_bytes=3 * MB, spill_dir=str(tmp_path), max_disk_bytes=4 * MB, idle_s=3600)
+    try:
+        a = store.put("a", _image(1))
+        store.put("b", _image(2))
+        store.put("c", _image(3))
+        assert store.get(a) is None
+        assert store.stats()["evictions"] == 1
+        assert store.stats()["disk_bytes"] <= store.max_disk_bytes
+    finally:
+        store.close()
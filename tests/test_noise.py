@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from enhancer.noise import SaltPepperNoise, salt_and_pepper
+
+
+def _mid_gray(dtype, shape=(256, 256, 3)):
+    # Neither black nor white, so every changed pixel was hit by the noise
+    return np.full(shape, np.iinfo(dtype).max // 2, dtype=dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_same_seed_same_noise(dtype):
+    image = _mid_gray(dtype)
+    first = salt_and_pepper(image, amount=0.1, seed=42)
+    second = salt_and_pepper(image, amount=0.1, seed=42)
+    other = salt_and_pepper(image, amount=0.1, seed=43)
+    assert first.dtype == dtype
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, other)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("amount", [0.05, 0.3])
+def test_hit_ratio_matches_amount(dtype, amount):
+    image = _mid_gray(dtype, (512, 512))
+    noisy = salt_and_pepper(image, amount=amount, salt_vs_pepper=0.5, seed=0)
+    salt = noisy == np.iinfo(dtype).max
+    pepper = noisy == 0
+    assert abs((salt | pepper).mean() - amount) < 0.01
+    assert abs(salt.mean() - amount / 2) < 0.01
+
+
+def test_color_pixels_hit_in_every_channel():
+    noisy = salt_and_pepper(_mid_gray(np.uint8), amount=0.2, seed=1)
+    hit = noisy != 127
+    assert np.array_equal(hit.any(axis=2), hit.all(axis=2))
+
+
+def test_in_place_and_reused_buffers():
+    noise = SaltPepperNoise(amount=0.1, seed=3)
+    image = _mid_gray(np.uint8)
+    out = noise.apply(image, out=image)
+    assert out is image
+    assert (image != 127).any()
+    frames = list(noise.apply_many([_mid_gray(np.uint8) for _ in range(3)]))
+    assert len(frames) == 3
+    assert not np.array_equal(frames[0], frames[1])
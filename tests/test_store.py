@@ -0,0 +1,93 @@
+import json
+import threading
+
+import pytest
+
+from enhancer.store import SCHEMA_VERSION, UserStore
+
+LEGACY_USERS = {
+    "ada@example.com": {
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "dob": "1815-12-10",
+        "password": "engine",
+        "join_date": "2024-01-02",
+        "enhancement_count": 3,
+        "enhancement_types": ["Histogram", "Denoise"],
+        "enhancement_history": [
+            # Early entries stored the full UI label
+            {"enhancement": "Histogram Equalization (Contrast)", "date": "2024-01-02 09:15:00"},
+            {"technique": "Denoise", "date": "2024-01-02 09:40:00", "filename": "scan.png"},
+            {"technique": "Histogram", "date": "2024-01-03 18:00:00", "filename": "scan.png"},
+        ],
+    },
+    "bob@example.com": {
+        "first_name": "Bob",
+        "last_name": "Babbage",
+        "dob": "1791-12-26",
+        "password": "difference",
+        "join_date": "2024-02-01",
+    },
+}
+
+
+@pytest.fixture
+def legacy_json(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps(LEGACY_USERS))
+    return str(path)
+
+
+def test_legacy_json_is_imported_on_first_open(tmp_path, legacy_json):
+    store = UserStore(str(tmp_path / "users.db"), legacy_json=legacy_json)
+    assert store._user_version() == SCHEMA_VERSION
+    assert store.authenticate("ada@example.com", "engine")
+    assert store.exists("bob@example.com")
+
+    ada = store.get_user("ada@example.com")
+    assert ada["enhancement_count"] == 3
+    assert ada["enhancement_types"] == ["Histogram", "Denoise"]
+    assert [h["technique"] for h in ada["enhancement_history"]] == ["Histogram", "Denoise", "Histogram"]
+    assert store.get_user("bob@example.com")["enhancement_history"] == []
+
+    assert store.technique_counts("ada@example.com") == {"Histogram": 2, "Denoise": 1}
+    assert store.technique_counts("ada@example.com", "2024-01-03", "2024-01-03") == {"Histogram": 1}
+    assert store.activity("ada@example.com", granularity="day") == [("2024-01-02", 2), ("2024-01-03", 1)]
+
+
+def test_reopening_does_not_import_again(tmp_path, legacy_json):
+    path = str(tmp_path / "users.db")
+    UserStore(path, legacy_json=legacy_json)
+    store = UserStore(path, legacy_json=legacy_json)
+    assert len(store.history("ada@example.com")) == 3
+    assert store.migrate_from_json(legacy_json, only_once=True) == 0
+    assert len(store.history("ada@example.com")) == 3
+
+
+def test_concurrent_first_opens_import_once(tmp_path, legacy_json):
+    path = str(tmp_path / "users.db")
+    errors = []
+
+    def open_store():
+        try:
+            UserStore(path, legacy_json=legacy_json)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_store) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(UserStore(path).history("ada@example.com")) == 3
+
+
+def test_recorded_enhancements_update_aggregates(tmp_path, legacy_json):
+    store = UserStore(str(tmp_path / "users.db"), legacy_json=legacy_json)
+    store.record_enhancement("bob@example.com", "Sharpening", "a.png", date="2024-03-01 12:00:00")
+    assert store.get_user("bob@example.com")["enhancement_count"] == 1
+    assert store.technique_counts("bob@example.com") == {"Sharpening": 1}
+    assert store.activity("bob@example.com") == [("2024-03-01 12", 1)]
+    with pytest.raises(KeyError):
+        store.record_enhancement("nobody@example.com", "Sharpening")